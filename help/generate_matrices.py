@@ -25,9 +25,11 @@ import file_manager as fm
 #####################
 
 #  input: in_dir (str) full path to input directory containing .vcf file(s)
+#         sampler (str) strategy picking the sampled SVs and SNVs when there are more than sv_ub and const. a key of
+#           SAMPLERS
 # output: bp_attr (dict) key is breakpoint index. val is tuple (chrm (str), pos (int), extends_left (bool))
 #         cv_attr (dict) key (int) is segment index. val is tuple (chrm (str), bgn_pos (int), end_pos (int))
-def get_mats(in_dir, n, const=120, sv_ub=80):
+def get_mats(in_dir, n, const=120, sv_ub=80, sampler='random'):
     print("get mats")
     sampleList = fm._fnames_with_extension(in_dir, '.vcf')
 
@@ -85,7 +87,7 @@ def get_mats(in_dir, n, const=120, sv_ub=80):
 
     F_phasing, F_unsampled_phasing, G, G_unsampled, Q, Q_unsampled, A, H, cv_attr, F_info_phasing, F_unsampled_info_phasing, sampled_snv_list_sort, \
     unsampled_snv_list_sort, sampled_sv_list_sort, unsampled_sv_list_sort \
-        = make_matrices(m, n, l, g, r, G, sampleList, BP_sample_dict, BP_idx_dict, SNV_sample_dict, SNV_idx_dict, CN_sample_rec_dict, CN_sample_rec_dict_minor, CN_sample_rec_dict_major, CN_startPos_dict, CN_endPos_dict, const=const, sv_ub=sv_ub)
+        = make_matrices(m, n, l, g, r, G, sampleList, BP_sample_dict, BP_idx_dict, SNV_sample_dict, SNV_idx_dict, CN_sample_rec_dict, CN_sample_rec_dict_minor, CN_sample_rec_dict_major, CN_startPos_dict, CN_endPos_dict, const=const, sv_ub=sv_ub, sampler=sampler)
     bp_attr = _inv_dic(BP_idx_dict)
     
     F_phasing = np.array(F_phasing).astype(float)
@@ -194,9 +196,10 @@ def make_3d_list(r,c,d):
         result.append(temp)
     return result
 
+#  input: sampler (str) key of SAMPLERS. strategy picking the sampled SVs and SNVs
 # output: cv_attr (dict) key (int) is segment index. val is tuple (chrm (str), bgn_pos (int), end_pos (int))
 def make_matrices(m, n, l, g, r, G, sampleList, BP_sample_dict, BP_idx_dict,  SNV_sample_dict, SNV_idx_dict, CN_sample_rec_dict, \
-                  CN_sample_rec_dict_minor, CN_sample_rec_dict_major, CN_startPos_dict, CN_endPos_dict, const=120, sv_ub=80):
+                  CN_sample_rec_dict_minor, CN_sample_rec_dict_major, CN_startPos_dict, CN_endPos_dict, const=120, sv_ub=80, sampler='random'):
     """
     m : length of the sample list
     l : number of SVs
@@ -205,6 +208,14 @@ def make_matrices(m, n, l, g, r, G, sampleList, BP_sample_dict, BP_idx_dict,  SN
 
     print("Making Matrices")
 
+    # mixed copy number profiles and segments of the mutations, for samplers that look at the data
+    sample_muts = SAMPLERS[sampler]
+    snv_prof, snv_seg, bp_prof, bp_seg = None, None, None, None
+    if sampler != 'random':
+        seg_dic = _get_seg_bgn_end_pos(CN_startPos_dict, CN_endPos_dict)
+        snv_prof, snv_seg = _get_snv_profiles(sampleList, SNV_sample_dict, SNV_idx_dict, seg_dic)
+        bp_prof, bp_seg = _get_bp_profiles(sampleList, BP_sample_dict, BP_idx_dict, seg_dic)
+
     if l > sv_ub:
         print(f"Warning: Number of SVs ({l}) exceeds SV_upperbound ({sv_ub}). Only the first {sv_ub} SVs will be processed. If you wish to use all SVs please set sv_ub to -1")
     if l + g > const:
@@ -254,16 +265,8 @@ def make_matrices(m, n, l, g, r, G, sampleList, BP_sample_dict, BP_idx_dict,  SN
             Q_SNV_unsampled = Q_unsampled
             F_CNV = F_phasing[:, const:]
             F_CNV_info = F_info_phasing[const:]
-            sampled_snv_idx_list_sorted = []
-            sampled_list = np.random.choice(a=len(SNV_idx_dict), size=const - l, replace=False)
-            unsampled_snv_idx_list_sorted = []
-            for i in np.arange(len(SNV_idx_dict)):
-                if i in sampled_list:
-                    sampled_snv_idx_list_sorted.append(i)
-                else:
-                    unsampled_snv_idx_list_sorted.append(i)
-            sampled_snv_idx_list_sorted = np.array(sampled_snv_idx_list_sorted)
-            unsampled_snv_idx_list_sorted = np.array(unsampled_snv_idx_list_sorted)
+            sampled_snv_idx_list_sorted = sample_muts(len(SNV_idx_dict), const - l, snv_prof, snv_seg)
+            unsampled_snv_idx_list_sorted = np.array([i for i in range(len(SNV_idx_dict)) if i not in sampled_snv_idx_list_sorted])
 
         elif l > const:
             print("l > const")
@@ -332,16 +335,8 @@ def make_matrices(m, n, l, g, r, G, sampleList, BP_sample_dict, BP_idx_dict,  SN
             F_CNV_info = F_info_phasing[const:]
             G_sampled = G
             G_unsampled = None
-            sampled_snv_idx_list_sorted = []
-            sampled_list = np.random.choice(a=len(SNV_idx_dict), size=const - l, replace=False)
-            unsampled_snv_idx_list_sorted = []
-            for i in np.arange(len(SNV_idx_dict)):
-                if i in sampled_list:
-                    sampled_snv_idx_list_sorted.append(i)
-                else:
-                    unsampled_snv_idx_list_sorted.append(i)
-            sampled_snv_idx_list_sorted = np.array(sampled_snv_idx_list_sorted)
-            unsampled_snv_idx_list_sorted = np.array(unsampled_snv_idx_list_sorted)
+            sampled_snv_idx_list_sorted = sample_muts(len(SNV_idx_dict), const - l, snv_prof, snv_seg)
+            unsampled_snv_idx_list_sorted = np.array([i for i in range(len(SNV_idx_dict)) if i not in sampled_snv_idx_list_sorted])
             sampled_sv_idx_list_sorted = np.arange(len(BP_idx_dict))
             unsampled_sv_idx_list_sorted = np.array([])
 
@@ -353,25 +348,10 @@ def make_matrices(m, n, l, g, r, G, sampleList, BP_sample_dict, BP_idx_dict,  SN
                         np.zeros((l+g-const, r)), np.zeros((m, sv_ub)), np.zeros((m, sv_ub))
             F_info_phasing, F_unsampled_info_phasing = make_2d_list(const + 2 * r, 3), make_2d_list(l + g - const, 3)
 
-            sampled_sv_idx_list_single = np.random.choice(a=min(len(BP_idx_dict), sv_ub), size=min(sv_ub, len(BP_idx_dict)) // 2, replace=False)
-            sampled_sv_idx_list_paired = np.where(G[sampled_sv_idx_list_single] == 1)[1]
-            sampled_sv_idx_list_paired = np.array(list(set(list(sampled_sv_idx_list_paired))))
-
-
-            while True:
-                if len(sampled_sv_idx_list_paired) < min(sv_ub, len(BP_idx_dict)):
-                    remaining = min(sv_ub, len(BP_idx_dict)) - len(sampled_sv_idx_list_paired)
-                    new_samples = np.random.choice(a=len(BP_idx_dict), size=remaining // 2, replace=False)
-                    sampled_sv_idx_list_single = np.append(sampled_sv_idx_list_single, new_samples)
-                    sampled_sv_idx_list_paired = np.where(G[sampled_sv_idx_list_single] == 1)[1]
-                    sampled_sv_idx_list_paired = np.array(list(set(list(sampled_sv_idx_list_paired))))
-                else:
-                    break
-
-            sampled_sv_idx_list_paired = sampled_sv_idx_list_paired[:sv_ub]  # Ensure we don't exceed sv_ub
+            sampled_sv_idx_list_paired = sample_muts(len(BP_idx_dict), sv_ub, bp_prof, bp_seg, G)
             sampled_sv_num = len(sampled_sv_idx_list_paired) # 80
 
-            assert sampled_sv_num == sv_ub
+            assert sampled_sv_num <= sv_ub  # samplers that keep mate pairs whole leave a slot free for an odd sv_ub
 
             # Determine unsampled SVs
             unsampled_sv_idx_list_sorted = np.array([i for i in range(len(BP_idx_dict)) if i not in sampled_sv_idx_list_paired])
@@ -426,24 +406,13 @@ def make_matrices(m, n, l, g, r, G, sampleList, BP_sample_dict, BP_idx_dict,  SN
             sampled_sv_idx_list_sorted = sampled_sv_idx_list_paired
             unsampled_sv_idx_list_sorted = np.array([i for i in range(len(BP_idx_dict)) if i not in sampled_sv_idx_list_sorted])
 
-            sampled_snv_idx_list_sorted = np.random.choice(len(SNV_idx_dict), size=min(remaining_const, len(SNV_idx_dict)), replace=False)
-            unsampled_snv_idx_list_sorted = np.array([i for i in range(len(SNV_idx_dict)) if i not in sampled_snv_idx_list_sorted])
-
             print(("G", G))
             G_sampled = G[sampled_sv_idx_list_sorted,:][:, sampled_sv_idx_list_sorted]
             G_unsampled = G[unsampled_sv_idx_list_sorted,:][:, unsampled_sv_idx_list_sorted]
             print(("G_sampled", G_sampled))
             print(("G_unsampled", G_unsampled))
-            sampled_snv_idx_list_sorted = []
-            sampled_list = np.random.choice(a=len(SNV_idx_dict), size=const - len(sampled_sv_idx_list_sorted), replace=False)
-            unsampled_snv_idx_list_sorted = []
-            for i in np.arange(len(SNV_idx_dict)):
-                if i in sampled_list:
-                    sampled_snv_idx_list_sorted.append(i)
-                else:
-                    unsampled_snv_idx_list_sorted.append(i)
-            sampled_snv_idx_list_sorted = np.array(sampled_snv_idx_list_sorted)
-            unsampled_snv_idx_list_sorted = np.array(unsampled_snv_idx_list_sorted)
+            sampled_snv_idx_list_sorted = sample_muts(len(SNV_idx_dict), const - len(sampled_sv_idx_list_sorted), snv_prof, snv_seg)
+            unsampled_snv_idx_list_sorted = np.array([i for i in range(len(SNV_idx_dict)) if i not in sampled_snv_idx_list_sorted])
 
 
 
@@ -663,6 +632,113 @@ def make_matrices(m, n, l, g, r, G, sampleList, BP_sample_dict, BP_idx_dict,  SN
     return F_phasing, F_unsampled_phasing, G_sampled, G_unsampled, Q, Q_unsampled, A, H, cv_attr, F_info_phasing, F_unsampled_info_phasing, sampled_snv_idx_list_sorted, unsampled_snv_idx_list_sorted, sampled_sv_idx_list_sorted, unsampled_sv_idx_list_sorted
     ### A and H are empty lists
 
+#######################
+##### SUBSAMPLING #####
+#######################
+
+# samplers pick which mutations make_matrices keeps in F. each is called as sampler(num, k, profiles, segs, G) and
+#   returns the sorted indices of at most k of the num mutations
+#  input: num (int) number of mutations
+#         k (int) number of mutations to keep
+#         profiles (None or np.array of float) [num, m] mixed copy number of each mutation in each sample
+#         segs (None or np.array of int) [num] segment of each mutation. -1 if it is in no segment
+#         G (None or np.array of 0 or 1) [num, num] mates of each breakpoint. None for SNVs
+
+# uniform sample. breakpoints are drawn until their mates fill k, and the list is then cut at k
+def sample_random(num, k, profiles=None, segs=None, G=None):
+    if G is None:
+        return np.sort(np.random.choice(a=num, size=min(k, num), replace=False))
+    sampled_sv_idx_list_single = np.random.choice(a=min(num, k), size=min(k, num) // 2, replace=False)
+    sampled_sv_idx_list_paired = np.where(G[sampled_sv_idx_list_single] == 1)[1]
+    sampled_sv_idx_list_paired = np.array(list(set(list(sampled_sv_idx_list_paired))))
+
+    while True:
+        if len(sampled_sv_idx_list_paired) < min(k, num):
+            remaining = min(k, num) - len(sampled_sv_idx_list_paired)
+            new_samples = np.random.choice(a=num, size=remaining // 2, replace=False)
+            sampled_sv_idx_list_single = np.append(sampled_sv_idx_list_single, new_samples)
+            sampled_sv_idx_list_paired = np.where(G[sampled_sv_idx_list_single] == 1)[1]
+            sampled_sv_idx_list_paired = np.array(list(set(list(sampled_sv_idx_list_paired))))
+        else:
+            break
+
+    return sampled_sv_idx_list_paired[:k]  # Ensure we don't exceed k
+
+
+# mutations whose mixed copy numbers vary most across samples tell the clones apart best. a first pass keeps the
+#   most varying unit of every segment, so each segment holding a mutation is covered, and a second pass fills the
+#   rest of k by variance. a unit is a breakpoint with its mates in G, which are kept or dropped together, or a
+#   single SNV
+def sample_informative(num, k, profiles, segs, G=None):
+    units = _get_mate_units(num, G)
+    var = profiles.var(axis=1)
+    order = np.argsort([ -var[u].mean() for u in units ], kind='stable')
+    picked, covered, size = set(), set(), 0
+    for cover in [True, False]:
+        for i in order:
+            u = units[i]
+            if i in picked or size + len(u) > k:
+                continue
+            if cover and all([ segs[b] in covered or segs[b] < 0 for b in u ]):  # covers no new segment
+                continue
+            picked.add(i)
+            covered.update([ segs[b] for b in u ])
+            size += len(u)
+    return np.array(sorted([ b for i in picked for b in units[i] ]), dtype=int)
+
+
+SAMPLERS = {'random': sample_random, 'informative': sample_informative}
+
+
+# groups of mutations that are sampled together. each breakpoint with its mates in G, or each mutation on its own
+def _get_mate_units(num, G=None):
+    if G is None:
+        return [ [i] for i in range(0, num) ]
+    units, seen = [], set()
+    for i in range(0, num):
+        if i in seen:
+            continue
+        u = sorted(set([i] + list(np.where(G[i] == 1)[0])))
+        seen.update(u)
+        units.append(u)
+    return units
+
+
+# output: profiles (np.array of float) [g, m] mixed copy number of each SNV in each sample. 0 if it is not called
+#         segs (np.array of int) [g] segment of each SNV. -1 if it is in no segment
+def _get_snv_profiles(sampleList, SNV_sample_dict, SNV_idx_dict, seg_dic):
+    profiles = np.zeros((len(SNV_idx_dict), len(sampleList)))
+    segs = -np.ones(len(SNV_idx_dict), dtype=int)
+    for (chrom, pos), snv_idx in SNV_idx_dict.items():
+        if chrom in seg_dic:
+            seg = _get_seg_idx(seg_dic[chrom], pos)
+            segs[snv_idx] = seg if seg != None else -1
+    for sample_idx, sample in enumerate(sampleList):
+        for key, cn in SNV_sample_dict[sample].items():
+            profiles[SNV_idx_dict[key], sample_idx] = cn[0] if isinstance(cn, list) else cn
+    return profiles, segs
+
+
+# output: profiles (np.array of float) [l, m] mixed copy number of each breakpoint in each sample. 0 if it is not called
+#         segs (np.array of int) [l] segment of each breakpoint. -1 if it is in no segment
+def _get_bp_profiles(sampleList, BP_sample_dict, BP_idx_dict, seg_dic):
+    profiles = np.zeros((len(BP_idx_dict), len(sampleList)))
+    segs = -np.ones(len(BP_idx_dict), dtype=int)
+    for (chrom, pos, direction), bp_idx in BP_idx_dict.items():
+        if chrom in seg_dic:
+            seg = _get_seg_idx(seg_dic[chrom], pos)
+            segs[bp_idx] = seg if seg != None else -1
+    for sample_idx, sample in enumerate(sampleList):
+        for chrom in BP_sample_dict[sample]:
+            for pos in BP_sample_dict[sample][chrom]:
+                for bp_id in BP_sample_dict[sample][chrom][pos]:
+                    temp_bp_info_dict = BP_sample_dict[sample][chrom][pos][bp_id]
+                    cn = temp_bp_info_dict['cn']
+                    bp_idx = BP_idx_dict[(chrom, pos, temp_bp_info_dict['dir'])]
+                    profiles[bp_idx, sample_idx] = cn[0] if isinstance(cn, list) else cn
+    return profiles, segs
+
+
 #  input: segs (list of tuple) tuple is ( seg_idx, bgn_pos, end_pos ) for segments of a single chromosome
 #         pos (int) position of segment that will be returned
 # output: i (int) index of segment where pos lies
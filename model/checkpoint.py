@@ -0,0 +1,50 @@
+#   checkpoints of long unmix runs. every entry is one pickle file in a checkpoint directory, written to a
+#   temporary file first and renamed into place so a preempted run never leaves a half written checkpoint
+
+
+# # # # # # # # # # #
+#   I M P O R T S   #
+# # # # # # # # # # #
+
+import os
+import pickle
+
+# # # # # # # # # # # # #
+#   C O N S T A N T S   #
+# # # # # # # # # # # # #
+
+EXT = '.pkl'
+
+
+# # # # # # # # # # # # #
+#   F U N C T I O N S   #
+# # # # # # # # # # # # #
+
+# returns path of checkpoint entry name in directory ckpt_dir
+def get_path(ckpt_dir, name):
+    return os.path.join(ckpt_dir, name + EXT)
+
+
+# atomically writes obj to path
+def save(path, obj):
+    tmp = path + '.tmp.' + str(os.getpid())
+    with open(tmp, 'wb') as f:
+        pickle.dump(obj, f, protocol = pickle.HIGHEST_PROTOCOL)
+        f.flush()
+        os.fsync(f.fileno())
+    os.replace(tmp, path)
+
+
+# returns the object saved at path. None if there is none
+def load(path):
+    if not os.path.isfile(path):
+        return None
+    with open(path, 'rb') as f:
+        return pickle.load(f)
+
+
+# removes every checkpoint entry of ckpt_dir. used when a run starts over instead of resuming
+def clear(ckpt_dir):
+    for fname in os.listdir(ckpt_dir):
+        if fname.endswith(EXT):
+            os.remove(os.path.join(ckpt_dir, fname))
@@ -0,0 +1,119 @@
+#   reversible compression of the input matrices. runs of adjacent copy number segments that have the same mixed
+#   copy numbers in every sample and hold no breakpoint are merged into one segment, and SNVs with the same mixed
+#   copy numbers in the same segment are solved as one SNV. the solution of the merged column is copied back to
+#   each of its members afterwards. column weights passed to the solver count how many original columns each
+#   compressed column stands for, so the objective is the one of the uncompressed problem for every solution that
+#   is equal on the members of each merged column
+
+
+# # # # # # # # # # #
+#   I M P O R T S   #
+# # # # # # # # # # #
+
+import numpy as np
+
+# # # # # # # # # # # # #
+#   C O N S T A N T S   #
+# # # # # # # # # # # # #
+
+SEG_TOL = 0.0  # largest difference in mixed copy number between merged segments
+
+
+# # # # # # # # # # # # # # # # # # # # # # # #
+#   S E G M E N T   C O M P R E S S I O N   #
+# # # # # # # # # # # # # # # # # # # # # # # #
+
+#  input: F_phasing (np.array of float) [m, l+g+2r] mixed copy number f_p,s of mutation s in sample p
+#         Q (np.array of 0 or 1) [l+g, r] q_b,s == 1 if breakpoint b is in segment s. 0 otherwise
+#         keep (np.array of bool) [r] segments that are never merged, e.g. the ones holding a breakpoint
+#         seg_chrm (None or list of str) [r] chromosome of each segment. None treats every segment as one chromosome
+#         tol (float) segments are merged into a run if their major and minor mixed copy numbers are all within tol
+#           of the first segment of the run
+#         weights (None or np.array of float) [l+g+2r] column weights of F_phasing, e.g. from compress_snvs. None
+#           weighs every column 1
+# output: F_c (np.array of float) [m, l+g+2r'] F_phasing with each run of segments replaced by its mean columns
+#         Q_c (np.array of 0 or 1) [l+g, r'] Q with the columns of each run summed
+#         groups (list of list of int) [r'] original segments of each compressed segment, in order
+#         weights (np.array of float) [l+g+2r'] weights summed over the members of each column of F_c
+#  notes: segments are adjacent if they follow one another in F_phasing, on the same chromosome
+def compress_segments(F_phasing, Q, keep, seg_chrm=None, tol=SEG_TOL, weights=None):
+    l_g, r = Q.shape
+    if weights is None:
+        weights = np.ones(F_phasing.shape[1])
+    F_maj, F_min = F_phasing[:, l_g:l_g + r], F_phasing[:, l_g + r:]
+    groups = []
+    for s in range(0, r):
+        if groups and not keep[s] and not keep[groups[-1][0]] and (seg_chrm is None or seg_chrm[s] == seg_chrm[groups[-1][0]]):
+            first = groups[-1][0]
+            if np.abs(F_maj[:, s] - F_maj[:, first]).max() <= tol and np.abs(F_min[:, s] - F_min[:, first]).max() <= tol:
+                groups[-1].append(s)
+                continue
+        groups.append([s])
+
+    M = np.zeros((r, len(groups)))  # M[s, t] == 1 iff segment s is merged into compressed segment t
+    for t, group in enumerate(groups):
+        M[group, t] = 1
+    sizes = M.sum(axis=0)
+    F_c = np.concatenate([F_phasing[:, :l_g], F_maj.dot(M) / sizes, F_min.dot(M) / sizes], axis=1)
+    Q_c = np.rint(Q.dot(M)).astype(Q.dtype)
+    weights = np.concatenate([weights[:l_g], weights[l_g:l_g + r].dot(M), weights[l_g + r:].dot(M)])
+    return F_c, Q_c, groups, weights
+
+
+#  input: C (np.array of int) [2n-1, l+g+2r'] copy numbers solved on the output of compress_segments
+#         groups (list of list of int) [r'] output of compress_segments
+#         l_g (int) number of breakpoint and SNV columns
+# output: C (np.array of int) [2n-1, l+g+2r] every original segment gets the copy numbers of its compressed segment
+def expand_C(C, groups, l_g):
+    r_c = len(groups)
+    seg = np.zeros(sum([ len(group) for group in groups ]), dtype=int)  # compressed segment of each original segment
+    for t, group in enumerate(groups):
+        seg[group] = t
+    return np.concatenate([C[:, :l_g], C[:, l_g + seg], C[:, l_g + r_c + seg]], axis=1)
+
+
+# # # # # # # # # # # # # # # # # # # # #
+#   S N V   D E D U P L I C A T I O N   #
+# # # # # # # # # # # # # # # # # # # # #
+
+#  input: F_phasing (np.array of float) [m, l+g+2r] mixed copy number f_p,s of mutation s in sample p
+#         Q (np.array of 0 or 1) [l+g, r] q_b,s == 1 if breakpoint b is in segment s. 0 otherwise
+#         l (int) number of breakpoints. rows l to l+g of Q are SNVs
+#         weights (None or np.array of float) [l+g+2r] column weights of F_phasing. None weighs every column 1
+# output: F_c (np.array of float) [m, l+g'+2r] F_phasing with only the first SNV of each group of equal SNVs
+#         Q_c (np.array of 0 or 1) [l+g', r] Q with the same SNV rows
+#         snv_index (np.array of int) [g] group of each SNV, the index of its representative among the g' kept SNVs
+#         weights (np.array of float) [l+g'+2r] weights summed over the SNVs of each group
+#  notes: SNVs are equal if their columns of F_phasing and rows of Q are. the representative stands for its group
+#         in the unmixing error and bpf penalty, so all SNVs of a group are placed on the same edge
+def compress_snvs(F_phasing, Q, l, weights=None):
+    l_g, r = Q.shape
+    if weights is None:
+        weights = np.ones(F_phasing.shape[1])
+    groups = {}  # (F column, Q row) of a representative -> its index among the kept SNVs
+    reps = []
+    snv_index = np.zeros(l_g - l, dtype=int)
+    for b in range(l, l_g):
+        key = (F_phasing[:, b].tobytes(), Q[b].tobytes())
+        if key not in groups:
+            groups[key] = len(reps)
+            reps.append(b)
+        snv_index[b - l] = groups[key]
+    rows = list(range(0, l)) + reps
+    F_c = np.concatenate([F_phasing[:, rows], F_phasing[:, l_g:]], axis=1)
+    mult = np.bincount(snv_index, weights=weights[l:l_g], minlength=len(reps))
+    weights = np.concatenate([weights[:l], mult, weights[l_g:]])
+    return F_c, Q[rows], snv_index, weights
+
+
+#  input: C (np.array of int) [2n-1, l+g'+2r] copy numbers solved on the output of compress_snvs
+#         W (np.array of int) [2n-1, l+g'] node each breakpoint and kept SNV appears at
+#         W_snv (np.array of int) [2n-1, g'] node each kept SNV appears at
+#         snv_index (np.array of int) [g] output of compress_snvs
+#         l (int) number of breakpoints
+# output: C, W and W_snv with g SNV columns, each SNV getting the columns of its representative
+def expand_snvs(C, W, W_snv, snv_index, l):
+    g_c = W_snv.shape[1]
+    C = np.concatenate([C[:, :l], C[:, l + snv_index], C[:, l + g_c:]], axis=1)
+    W = np.concatenate([W[:, :l], W[:, l + snv_index]], axis=1)
+    return C, W, W_snv[:, snv_index]
@@ -11,9 +11,17 @@ import os
 import argparse  
 import math  
 import numpy as np
+import scipy.sparse as sp
+from scipy.optimize import linprog
+from concurrent.futures import ThreadPoolExecutor
 import gurobipy as gp
 from gurobipy import GRB
+import tree_dp as td
+import checkpoint as ckpt
 import time
+import zlib
+import hashlib
+import multiprocessing as mp
 
 # # # # # # # # # # # # #
 #   C O N S T A N T S   #
@@ -21,6 +29,16 @@ import time
 
 U_MIN = 0.0
 MAX_SOLVER_ITERS = 5000
+MAX_ENUM_LEAVES = 5  # largest n for which get_C may enumerate every tree topology
+NMF_ITERS = 200
+U_INIT_CANDIDATES = 16  # factorizations gen_U_init picks restarts from
+POOL_FACTOR = 4  # pool solutions kept per start asked of get_pool_starts
+INCUMBENT_POLL = 1.0  # seconds between reads of the shared incumbent in the C step callback
+STALL_GAP = 2e-2  # change in relative gap that counts as progress for StopPolicy.stall_time
+DEFAULT_MIP_GAP = 1e-4  # gurobi's MIPGap
+MIN_SOLVE_TIME = 1.0  # smallest time limit a Budget gives a solve while that much is left
+OUT_OF_TIME_SHARE = 2.0  # share of the remaining budget, in equal shares, given to a C step after one that ran out of time
+BOUND_SLACK = 1  # copies allowed above the largest mixed copy number of a segment by get_C_bounds
 
 
 # # # # # # # # # # # # #
@@ -39,6 +57,31 @@ MAX_SOLVER_ITERS = 5000
 #         max_iters (int) maximum number of iterations to predict U then C if convergence not reached
 #         time_limit (int) maximum number of seconds the solver will run
 #         only_leaf (boolean) the flag indicating the if the model assumes that samples are unmixed by only leaf node clones, default is False.
+#         threads (int or None) number of threads each gurobi solve may use. None lets gurobi use every core
+#         u_solver (str) 'gurobi' solves the U step with get_U. 'highs' solves it with get_U_highs
+#         ancestry (str) 'full' uses _set_ancestry_constraints. 'depth' uses the compact _set_depth_constraints
+#         zero_enc (str) encoding of "is this integer zero" for C_bin and X_bin. see get_C
+#         tree_refine (boolean) refine the final C on the final tree with tree_dp.get_C_tree, kept if it lowers obj_val
+#         enumerate_trees (boolean) solve every C step by enumerating tree topologies on one pool of threads processes
+#           made for the run. ancestry and symmetry do not apply to a fixed tree and are ignored. see get_C. the
+#           stop reason of each C step is that of get_C_enumerated
+#         u_init (str) 'random' starts from gen_U. 'nmf' starts from a factorization of the segment columns of
+#           F_phasing, see gen_U_init
+#         restart (int) index of this restart. with u_init 'nmf' each restart gets a different starting U
+#         init (None or tuple) (C, E, A, R, W_node) of a solved C step, e.g. from get_pool_starts. coordinate descent
+#           then starts with the U step for this C instead of from a starting U
+#         shared (None or SharedIncumbent) incumbent shared by all restarts. the restart stops once a C step lower
+#           bound exceeds the best finished restart, or once it reaches a C another restart has already visited
+#         stop_policy (None or StopPolicy) when each C step solve may stop early. see get_C early_term
+#         budget (None or Budget) wall clock budget of this run. each C step gets an equal share of what is left
+#           for the remaining iterations, more after a C step that ran out of time (Budget.get_time_limit), at most
+#           time_limit, and the run stops with its last iterate when it expires
+#         tight_bounds (boolean) bound the C step variables with get_C_bounds. see get_C
+#         fix_tol (None or float) with tight_bounds, fix segments within fix_tol of 1 in every sample. see get_C
+#         symmetry (boolean) add symmetry breaking rows to the C step. see get_C
+#         weights (None or np.array of float) column weights of F_phasing. see get_C
+#         checkpoint (None or str) checkpoint file of this run. every iterate is saved to it. if it holds a finished
+#           run that result is returned, and if it holds an unfinished one the run continues from its last iterate
 # output: U (np.array of float) [m, 2n-1] 0 <= u_p,k <= 1. percent of sample p made by clone k
 #         C (np.array of int) [2n-1, l+g+2r] int copy number c_k,s of mutation s in clone k
 #         E (np.array of int) [2n-1, 2n-1] e_i,j == 1 iff edge (i,j) is in tree. 0 otherwise
@@ -46,62 +89,201 @@ MAX_SOLVER_ITERS = 5000
 #         W_all (np.array of int) [2n-1, 2n-1] number of breakpoints appearing along each edge in tree
 #         obj_val (float) objective value of final solution
 #         err_msg (None or str) None if no error occurs. str with error message if one does
+#         metrics (dict) 'iterations' run, 'stop_reason' of coordinate descent ('converged', 'max_iters', 'abandoned',
+#           'duplicate', 'budget' or 'preempted') and 'c_step_stops', the stop reason of each C step solve
+#  notes: once preempt() is called the running C step stops at its next callback and the run returns its last
+#         iterate. its checkpoint is left unfinished so a resumed run continues it
 #  notes: l (int) is number of breakpoints depicting structural variants. r (int) is number of copy number regions, 2r means we phase it for allelic copy numbers,
 #         g (int) is number of single nucleotide variants.
 
-def get_UCE(F_phasing, Q, G, A, H, n, c_max, lamb1, lamb2, max_iters, time_limit=None, only_leaf=False):
+def get_UCE(F_phasing, Q, G, A, H, n, c_max, lamb1, lamb2, max_iters, time_limit=None, only_leaf=False, threads=None, u_solver='gurobi', ancestry='full', zero_enc='bits', tree_refine=False, enumerate_trees=False, u_init='random', restart=0, init=None, shared=None, stop_policy=None, budget=None, checkpoint=None, tight_bounds=False, symmetry=False, weights=None, fix_tol=None):
     np.random.seed()  # sets seed for running on multiple processors
     m = len(F_phasing)
     l_g_sample, r = Q.shape
     l,_ = G.shape
     g = l_g_sample - l
+    metrics = {'iterations': 0, 'stop_reason': 'max_iters', 'c_step_stops': []}
+    first_iter = 0
+    last = None  # last finished iterate (U, C, E, A, R, W, W_sv, W_snv, obj_val)
+    saved = ckpt.load(checkpoint) if checkpoint is not None else None
+    if saved is not None:
+        if saved['done']:
+            print('Run in ' + checkpoint + ' is already complete')
+            return saved['result']
+        U, C, E, A, R, W, W_sv, W_snv, obj_val = last = saved['iterate']
+        init = (C, E, A, R, W)
+        first_iter, metrics = saved['metrics']['iterations'], saved['metrics']
+        print('Resuming run in ' + checkpoint + ' after iteration ' + str(first_iter))
+
+    enumerating = enumerate_trees and n <= MAX_ENUM_LEAVES
+    if not enumerating:
+        solver = CSolver(F_phasing, Q, G, n, c_max, lamb1, lamb2, threads, ancestry, zero_enc, tight_bounds=tight_bounds, symmetry=symmetry, weights=weights, fix_tol=fix_tol)  # structural part of the C step is built once
+    incumbent = shared.best if shared is not None else None
+    if budget is not None:
+        budget = budget.start_run()
+        if budget.expired() and init is None:  # started after the budget ran out. nothing to return
+            metrics['stop_reason'] = 'budget'
+            return None, None, None, None, None, None, None, None, float('inf'), 'time budget spent before the run started', metrics
+
+    if init is not None:
+        C, E, A, R, W = init
+        prevC = C
+
+    enum_pool, processes = None, 1
+    if enumerating:  # topologies of every C step are solved on one pool of threads processes
+        processes = threads if threads != None else mp.cpu_count()
+        if processes > 1 and not mp.current_process().daemon:
+            enum_pool = mp.Pool(processes = processes)
 
-    for i in range(0, max_iters):
+    for i in range(first_iter, max_iters):
+        if budget is not None:
+            if budget.expired() and i > 0:
+                metrics['stop_reason'] = 'budget'
+                break
+            last_stop = metrics['c_step_stops'][-1] if metrics['c_step_stops'] else None
+            solve_time = budget.get_time_limit(time_limit, max_iters - i, last_stop)
+        else:
+            solve_time = time_limit
 
-        if i == 0:
-            U = gen_U(m, n)
+        if i == 0 and init is None:
+            U = gen_U_init(F_phasing, Q, n, only_leaf, restart) if u_init == 'nmf' else gen_U(m, n)
+            start = gen_start(n, l, g, r)
         else:
-            U = get_U(F_phasing, C, n, R, W, l, only_leaf)
+            if u_solver == 'highs':
+                U, err_msg = get_U_highs(F_phasing, C, n, R, W, l, only_leaf, threads, weights)
+                if err_msg != None:
+                    _close_pool(enum_pool)
+                    return None, None, None, None, None, None, None, None, float('inf'), err_msg, metrics
+            else:
+                U = get_U(F_phasing, C, n, R, W, l, only_leaf, threads, weights)
+            start = (C, E, A, R, W)  # previous iterate is usually feasible and close to optimal
 
-        obj_val, C, E, A, R, W, W_sv, W_snv, err_msg = get_C(F_phasing, U, Q, G, A, H, n, c_max, lamb1, lamb2, time_limit)
+        if enumerating:
+            (obj_val, C, E, A, R, W, W_sv, W_snv, err_msg), enum_stop = get_C_enumerated(F_phasing, U, Q, G, n, c_max, lamb1, lamb2, solve_time, processes, zero_enc, weights, enum_pool, tight_bounds, fix_tol)
+            metrics['c_step_stops'].append(enum_stop)
+        else:
+            obj_val, C, E, A, R, W, W_sv, W_snv, err_msg = solver.solve(U, solve_time, early_term=stop_policy, start=start, incumbent=incumbent)
+            metrics['c_step_stops'].append(solver.stop_reason)
+        metrics['iterations'] = i + 1
+
+        if preempted():  # SIGTERM. the interrupted C step is kept if it found a solution
+            metrics['stop_reason'] = 'preempted'
+            if err_msg == None:
+                last = (U, C, E, A, R, W, W_sv, W_snv, obj_val)
+            _close_pool(enum_pool)
+            if last is None:
+                return None, None, None, None, None, None, None, None, float('inf'), 'preempted before the first C step found a solution', metrics
+            U, C, E, A, R, W, W_sv, W_snv, obj_val = last
+            if shared is not None:
+                shared.update(obj_val)
+            return U, C, E, A, R, W, W_sv, W_snv, obj_val, None, metrics
 
         # handle errors
         if err_msg != None:
-            return None, None, None, None, None, None, err_msg
+            _close_pool(enum_pool)
+            return None, None, None, None, None, None, None, None, float('inf'), err_msg, metrics
 
-        if i > 0:
+        if shared is not None:
+            if not enumerating and solver.stop_reason == 'abandoned':
+                print('Restart ' + str(restart) + ' abandoned. its lower bound is above the incumbent ' + str(incumbent()))
+                metrics['stop_reason'] = 'abandoned'
+                break
+            if not shared.claim(C, restart):
+                print('Restart ' + str(restart) + ' reached the C of another restart and is stopped')
+                metrics['stop_reason'] = 'duplicate'
+                break
+
+        if checkpoint is not None:
+            ckpt.save(checkpoint, {'done': False, 'iterate': (U, C, E, A, R, W, W_sv, W_snv, obj_val), 'metrics': metrics})
+        last = (U, C, E, A, R, W, W_sv, W_snv, obj_val)
+
+        if i > 0 or init is not None:
             if abs((C - prevC)).sum() == 0:
+                metrics['stop_reason'] = 'converged'
                 break
 
         prevC = C
 
-    return U, C, E, A, R, W, W_sv, W_snv, obj_val, None
+    _close_pool(enum_pool)
+    if tree_refine and weights is None:  # the tree dynamic program has no column weights
+        refined = td.get_C_tree(F_phasing, U, E, Q, G, n, c_max, lamb1, lamb2, C_init=C, threads=threads)
+        if refined[0] < obj_val:
+            obj_val, C, E, A, R, W, W_sv, W_snv, _ = refined
+
+    if shared is not None:
+        shared.update(obj_val)
+    if checkpoint is not None:
+        ckpt.save(checkpoint, {'done': True, 'result': (U, C, E, A, R, W, W_sv, W_snv, obj_val, None, metrics)})
+    return U, C, E, A, R, W, W_sv, W_snv, obj_val, None, metrics
 
 
 #  input: F (np.array of float) [m, l+g+2r] mixed copy number f_p,s of mutation s in sample p
 #         C (np.array of int) [2n-1, l+g+2r] int copy number c_k,s of mutation s in clone k
 #         n (int) number of leaves in phylogeny. 2n-1 is total number of nodes
+#         threads (int or None) number of threads gurobi may use. None lets gurobi use every core
+#         weights (None or np.array of float) [l+g+2r] weight of the unmixing error of each column. None weighs all 1
 # output: U (np.array of float) [m, 2n-1] 0 <= u_p,k <= 1. percent of sample p made by clone k
-def get_U(F_phasing, C, n, R, W_node, l, only_leaf):
+def get_U(F_phasing, C, n, R, W_node, l, only_leaf, threads=None, weights=None):
     m, L = F_phasing.shape  ### xf: L=l(+g)+2r depending on if SNVs are included
     N = 2 * n - 1
     mod = gp.Model('tusv')
     U = _get_gp_arr_cnt_var(mod, m, N, 1.0)
-    for i in range(0, m):
-        mod.addConstr(gp.quicksum(U[i, :]) == 1.0, "Frequencies sum equals to 1")
-        if only_leaf:
-            mod.addConstr(gp.quicksum(U[i, n: -1]) == 0.0, "Internal nodes have zero frequencies")
-    sums = []
-    for p in range(0, m):
-        for s in range(0, L):
-            f_hat = gp.quicksum([U[p, k] * C[k, s] for k in range(0, N)])  ### xf: Now U remains m*N, C becomes N*(l(+g)+2r), F is m*(l(+g)+2r)
-            sums.append(_get_abs(mod, F_phasing[p, s] - f_hat))
-    mod.setObjective(gp.quicksum(sums), gp.GRB.MINIMIZE)
+    mod.addConstr(U.sum(axis=1) == 1.0, "Frequencies sum equals to 1")
+    if only_leaf:
+        mod.addConstr(U[:, n: -1].sum(axis=1) == 0.0, "Internal nodes have zero frequencies")
+    f_hat = U @ C[:, :L]  ### xf: Now U remains m*N, C becomes N*(l(+g)+2r), F is m*(l(+g)+2r)
+    if weights is None:
+        weights = np.ones(L)
+    mod.setObjective((_get_abs(mod, F_phasing - f_hat) @ weights).sum(), gp.GRB.MINIMIZE)
+    if threads != None:
+        mod.params.Threads = threads
     mod.optimize()
-    U = _as_solved(U)
+    return _threshold_U(_as_solved(U))
+
 
+#  input: same as get_U
+#         threads (int or None) number of samples solved concurrently. None solves them one after another
+# output: U (np.array of float or None) [m, 2n-1] 0 <= u_p,k <= 1. percent of sample p made by clone k. None if an
+#           LP fails
+#         err_msg (None or str) None if no error occurs. str with error message if one does
+#  notes: rows of U are independent given C, so each sample is its own least absolute deviation LP solved
+#         with scipy's HiGHS. no gurobi license is checked out. the constraint matrix is sparse, so its size is
+#         linear in the number of mutations
+def get_U_highs(F_phasing, C, n, R, W_node, l, only_leaf, threads=None, weights=None):
+    m, L = F_phasing.shape
+    N = 2 * n - 1
+    C_T = C[:, :L].T  # [L, N]
+    C_T = sp.csr_matrix(C_T)
+    I_L = sp.identity(L, format='csr')
+    c = np.concatenate([np.zeros(N), np.ones(L) if weights is None else weights])  # vars are [u_p (N), t_p (L)]. minimize weighted sum of t_p
+    A_ub = sp.bmat([[-C_T, -I_L], [C_T, -I_L]], format='csr')  # t_p >= f_p - C^T u_p and t_p >= C^T u_p - f_p
+    A_eq = np.concatenate([np.ones((1, N)), np.zeros((1, L))], axis=1)  # frequencies sum equals to 1
+    u_bounds = [(0.0, 1.0)] * N
+    if only_leaf:
+        u_bounds[n: N - 1] = [(0.0, 0.0)] * (N - 1 - n)  # internal nodes have zero frequencies
+    bounds = u_bounds + [(0.0, None)] * L
+
+    def solve_sample(p):
+        b_ub = np.concatenate([-F_phasing[p, :], F_phasing[p, :]])
+        res = linprog(c, A_ub=A_ub, b_ub=b_ub, A_eq=A_eq, b_eq=[1.0], bounds=bounds, method='highs')
+        return res
+
+    if threads != None and threads > 1:
+        with ThreadPoolExecutor(max_workers=threads) as pool:
+            results = list(pool.map(solve_sample, range(0, m)))
+    else:
+        results = [solve_sample(p) for p in range(0, m)]
+    for p, res in enumerate(results):
+        if not res.success:
+            return None, 'U step LP of sample ' + str(p) + ' failed with status ' + str(res.status) + ': ' + res.message
+    return _threshold_U(np.array([ res.x[:N] for res in results ])), None
+
+
+# zeros out entries of U at or below U_MIN and renormalizes U so all rows sum to 1
+def _threshold_U(U):
+    m, N = U.shape
     for i in range(m):
-        for j in range(2 * n - 1):
+        for j in range(N):
             if U[i, j] <= U_MIN:
                 U[i, j] = 0.0
 
@@ -124,6 +306,29 @@ def get_U(F_phasing, C, n, R, W_node, l, only_leaf):
 #         lamb1 (float) regularization term to weight total tree cost against unmixing error
 #         lamb2 (float) regularization term to weight breakpoint frequency error
 #         time_limit (int) maximum number of seconds the solver will run
+#         early_term (boolean or StopPolicy) when the solve may stop before proving optimality. True is
+#           StopPolicy(stall_time=10, min_runtime=100)
+#         threads (int or None) number of threads gurobi may use. None lets gurobi use every core
+#         start (None or tuple) (C, E, A, R, W_node) used as MIP start. entries equal to GRB.UNDEFINED, or
+#           entries that are None, are left for gurobi to complete
+#         ancestry (str) 'full' encodes A with the O(N^3) rows of _set_ancestry_constraints. 'depth' only
+#           forbids cycles with depth labels (_set_depth_constraints) and A is derived from the solved E
+#         zero_enc (str) encoding of the zero/non-zero indicators C_bin and X_bin. 'bits' uses the bit decomposition
+#           of _get_bin_rep, 'bigm' the two tight rows of _get_bigm_rep and 'indicator' gurobi indicator constraints
+#         enumerate_trees (boolean) for n <= MAX_ENUM_LEAVES, fix E to every tree topology in turn and solve the much
+#           smaller remaining problems on a pool of processes processes within time_limit. returns the best, which
+#           is a global optimum for U only if every topology was solved to optimality (see get_C_enumerated)
+#         tight_bounds (boolean) bound C, R, S and Gam column by column from F_phasing with get_C_bounds instead of
+#           [0, c_max]. the bounds come from the data, not a proof, so they can cut off the true optimum
+#         fix_tol (None or float) with tight_bounds, also fix every segment column within fix_tol of copy number 1 in
+#           every sample at 1 for every node. this drops low prevalence copy number changes, e.g. a 4% subclone
+#           with copy number 2 gives 1.04. None fixes none
+#         symmetry (boolean) add the symmetry breaking rows of _set_symmetry_constraints
+#         weights (None or np.array of float) [l+g+2r] number of original columns each column of F_phasing stands for,
+#           e.g. from compress.compress_segments and compress.compress_snvs. unmixing error, bpf penalty and the
+#           segment part of the tree cost are weighted by it. None weighs every column 1
+#         pool_size (int) with pool_size > 1 gurobi searches for the pool_size best solutions and a list of up to
+#           pool_size outputs, best first, is returned instead of one output
 # output: obj_val (float) objective value of solution
 #         C (np.array of int) [2n-1, l+g+2r] int copy number c_k,s of mutation s in clone k
 #         E (np.array of int) [2n-1, 2n-1] e_i,j == 1 iff edge (i,j) is in tree. 0 otherwise
@@ -131,48 +336,226 @@ def get_U(F_phasing, C, n, R, W_node, l, only_leaf):
 #         W_all (np.array of int) [2n-1, 2n-1] number of breakpoints appearing along each edge in tree
 #         err_msg (None or str) None if no error occurs. str with error message if one does
 #  notes: l (int) is number of breakpoints. g (int) is the number of single nucleotide variants. r (int) is number of copy number regions
-def get_C(F_phasing, U, Q, G, A, H, n, c_max, lamb1, lamb2, time_limit=None, early_term = False):
+def get_C(F_phasing, U, Q, G, A, H, n, c_max, lamb1, lamb2, time_limit=None, early_term = False, threads=None, start=None, ancestry='full', zero_enc='bits', enumerate_trees=False, processes=1, pool_size=1, tight_bounds=False, symmetry=False, weights=None, fix_tol=None):
+    if enumerate_trees and n <= MAX_ENUM_LEAVES:
+        return get_C_enumerated(F_phasing, U, Q, G, n, c_max, lamb1, lamb2, time_limit, processes, zero_enc, weights, tight_bounds=tight_bounds, fix_tol=fix_tol)[0]
+    solver = CSolver(F_phasing, Q, G, n, c_max, lamb1, lamb2, threads, ancestry, zero_enc, tight_bounds=tight_bounds, symmetry=symmetry, weights=weights, fix_tol=fix_tol)
+    if pool_size > 1:
+        return solver.solve_pool(U, pool_size, time_limit, early_term, start)
+    return solver.solve(U, time_limit, early_term, start)
+
+
+#  input: same as get_UCE
+#         num_starts (int) number of starts wanted
+# output: starts (list of tuple) up to num_starts (C, E, A, R, W_node), each a solved C step for init of get_UCE
+#  notes: one C step is solved from a starting U with a solution pool of POOL_FACTOR * num_starts solutions. the
+#         best solution is kept and then, greedily, the pool solution whose (C, E) is farthest from those kept. this
+#         gives the spread of separate random restarts for the build and presolve cost of a single solve
+def get_pool_starts(F_phasing, Q, G, n, c_max, lamb1, lamb2, num_starts, time_limit=None, only_leaf=False, threads=None, ancestry='full', zero_enc='bits', u_init='random', tight_bounds=False, symmetry=False, weights=None, fix_tol=None):
+    m = len(F_phasing)
     l_g, r = Q.shape
     l, _ = G.shape
-    g = l_g - l
-    m, _ = U.shape
-    N = 2 * n - 1
-    print((l, g, r, m, N))
-    mod = gp.Model('tusv')
+    U = gen_U_init(F_phasing, Q, n, only_leaf) if u_init == 'nmf' else gen_U(m, n)
+    start = gen_start(n, l, l_g - l, r)
+    pool = get_C(F_phasing, U, Q, G, None, None, n, c_max, lamb1, lamb2, time_limit, threads=threads, start=start,
+                 ancestry=ancestry, zero_enc=zero_enc, pool_size=POOL_FACTOR * num_starts, tight_bounds=tight_bounds, symmetry=symmetry, weights=weights, fix_tol=fix_tol)
+    if not isinstance(pool, list):
+        pool = [pool]
+    pool = [ res for res in pool if res[-1] == None ]
+    if not pool:
+        return []
+
+    picked = [0]
+    dist = np.array([ _solution_dist(res, pool[0]) for res in pool ])
+    while len(picked) < min(num_starts, len(pool)) and dist.max() > 0:  # identical (C, E) are never picked twice
+        i = int(dist.argmax())
+        picked.append(i)
+        dist = np.minimum(dist, [ _solution_dist(res, pool[i]) for res in pool ])
+    print('Kept ' + str(len(picked)) + ' of ' + str(len(pool)) + ' pool solutions as starts')
+    return [ tuple(pool[i][1:6]) for i in picked ]
+
+
+# distance between the (C, E) of two outputs of get_C
+def _solution_dist(res1, res2):
+    return np.abs(res1[1] - res2[1]).sum() + np.abs(res1[2] - res2[2]).sum()
+
+
+# solves the C step once for every tree topology on 2n-1 nodes (tree_dp.get_topologies) with E fixed and returns
+#   the best solution and a stop reason. the topologies are solved on pool, a pool of processes processes, or on a
+#   pool made for this call if pool is None. inside a pool worker they are solved one after another. time_limit is
+#   for all topologies together: each solve gets the share of it its process has and none runs past time_limit
+#   from the call, so topologies not reached by then are skipped. the stop reason is 'optimal' only if every
+#   topology was solved to optimality, and only then is the best solution the global optimum for U. otherwise
+#   it is 'uncertified' followed by the count of each topology stop reason
+def get_C_enumerated(F_phasing, U, Q, G, n, c_max, lamb1, lamb2, time_limit=None, processes=1, zero_enc='bits', weights=None, pool=None, tight_bounds=False, fix_tol=None):
+    topologies = td.get_topologies(n)
+    own_pool = pool is None and processes > 1 and not mp.current_process().daemon
+    if own_pool:
+        pool = mp.Pool(processes = min(processes, len(topologies)))
+    workers = min(processes, len(topologies)) if pool is not None else 1
+    tree_time = float(time_limit) * workers / len(topologies) if time_limit != None else None
+    deadline = time.time() + time_limit if time_limit != None else None
+    args = [ (F_phasing, U, Q, G, n, c_max, lamb1, lamb2, tree_time, deadline, zero_enc, weights, tight_bounds, fix_tol, E) for E in topologies ]
+    if pool is not None:
+        solved = pool.map(_solve_fixed_tree, args)  # ordered, so ties go to the first topology
+    else:
+        solved = list(map(_solve_fixed_tree, args))
+    if own_pool:
+        _close_pool(pool)
+    results = [ res for res, _ in solved ]
+    stops = [ stop for _, stop in solved ]
+    if all([ stop == 'optimal' for stop in stops ]):
+        stop_reason = 'optimal'
+    else:
+        stop_reason = 'uncertified(' + ' '.join([ s + '=' + str(stops.count(s)) for s in sorted(set(stops)) ]) + ')'
+    print('Solved ' + str(len(topologies)) + ' tree topologies. ' + stop_reason)
+    obj_vals = [ res[0] for res in results ]
+    return results[int(np.argmin(obj_vals))], stop_reason
+
+
+def _close_pool(pool):
+    if pool is not None:
+        pool.close()
+        pool.join()
+
+
+# returns the get_C output of the C step with the tree fixed to E and its stop reason. 'skipped' if the deadline
+#   of get_C_enumerated has passed or the run was preempted before it started
+def _solve_fixed_tree(args):
+    F_phasing, U, Q, G, n, c_max, lamb1, lamb2, time_limit, deadline, zero_enc, weights, tight_bounds, fix_tol, E = args
+    if deadline != None:
+        time_limit = min(time_limit, deadline - time.time())
+    if (time_limit != None and time_limit <= 0) or preempted():
+        return (float('inf'), None, None, None, None, None, None, None, 'topology skipped'), 'skipped'
+    solver = CSolver(F_phasing, Q, G, n, c_max, lamb1, lamb2, threads=1, zero_enc=zero_enc, E_fixed=E, tight_bounds=tight_bounds, weights=weights, fix_tol=fix_tol)
+    return solver.solve(U, time_limit), solver.stop_reason
+
+
+# gurobi model for the C step that is built once per (F, Q, G, n, c_max) and reused across coordinate descent
+#   iterations. only the unmixing error and bpf penalty rows depend on U, so solve() swaps those rows and
+#   leaves the tree, ancestry, cost and gain/loss constraints in place. with E_fixed [N, N] the tree is given,
+#   edge variables exist only for its edges and the tree and ancestry constraints are dropped. with tight_bounds
+#   the copy number variables get the per column bounds of get_C_bounds, which also fixes columns if fix_tol is
+#   given. with symmetry the rows of _set_symmetry_constraints are added for each U. weights are the column
+#   weights of get_C
+class CSolver:
+    def __init__(self, F_phasing, Q, G, n, c_max, lamb1, lamb2, threads=None, ancestry='full', zero_enc='bits', E_fixed=None, tight_bounds=False, symmetry=False, weights=None, fix_tol=None):
+        l_g, r = Q.shape
+        l, _ = G.shape
+        g = l_g - l
+        m, L = F_phasing.shape
+        N = 2 * n - 1
+        print((l, g, r, m, N))
+        self.l, self.g, self.N = l, g, N
+        self.F_phasing = F_phasing
+        if weights is None:
+            weights = np.ones(L)
+        w_seg = weights[l_g:]  # [2r]
+        mod = gp.Model('tusv')
+
+        # edge dependent variables only exist for edges an internal node can have. E keeps every (i, j) so the
+        #   tree and ancestry constraints read as before, but its impossible entries have an upper bound of 0
+        edge_mask = _get_edge_mask(n) if E_fixed is None else np.rint(E_fixed)
+        edges = np.nonzero(edge_mask)  # (parents, children) of the K allowed edges
+        K = len(edges[0])
+        self.edges = edges
+
+        F_seg = (F_phasing[:, l_g:-r] + F_phasing[:, -r:]).dot(np.transpose(Q))  # [m, l] mixed copy number of segment containing breakpoint
+        self.Pi = np_divide_0(F_phasing[:, :l_g], F_seg)  # [m, l] expected bpf (ratio of bp copy num to segment copy num)
+        if tight_bounds:
+            C_lb, C_ub, fixed = get_C_bounds(F_phasing, Q, n, c_max, fix_tol=fix_tol)
+            print('Bounded C by column. ' + str(fixed.sum()) + ' of ' + str(2*r) + ' segment columns fixed at copy number 1')
+            bp_seg = Q.argmax(axis=1)
+            seg_ub = C_ub[:N - 1, l_g:].max(axis=0)  # [2r]
+            Gam_ub = np.stack([np.tile(seg_ub[bp_seg], (N, 1)), np.tile(seg_ub[bp_seg + r], (N, 1))], axis=2)  # [N, l+g, 2]
+            R_ub = (seg_ub * w_seg).sum()
+            S_ub = np.minimum(c_max, np.maximum(self.Pi * (seg_ub[bp_seg] + seg_ub[bp_seg + r]), C_ub[:, :l_g].max(axis=0)))  # [m, l+g]
+            C = mod.addMVar((N, l + g + 2*r), lb=C_lb, ub=C_ub, vtype=gp.GRB.INTEGER)
+        else:
+            C_ub, Gam_ub, R_ub, S_ub = c_max, c_max, c_max * w_seg.sum(), c_max
+            C = _get_gp_arr_int_var(mod, N, l + g + 2*r, c_max)  ### xf: C becomes N*(l+2r)
+        E = mod.addMVar((N, N), lb=0 if E_fixed is None else edge_mask, ub=edge_mask, vtype=gp.GRB.BINARY)
+        if ancestry == 'depth' or E_fixed is not None:
+            A = None  # derived from the solved E
+        else:
+            A = _get_gp_arr_bin_var(mod, N, N)  # ancestry matrix
+        R = _get_gp_1D_arr_int_var(mod, K, R_ub)  # rho. cost across each allowed edge ### xf: R also doubles because there is a cost for both alleles
+        S = _get_gp_arr_cnt_var(mod, m, l+g, S_ub)  # ess. bpf penalty for each bp in each sample
+        T = _get_gp_arr_cnt_var(mod, m, L)  # tau. unmixing error for each mutation in each sample
+        W = _get_gp_arr_bin_var(mod, K, l+g)  # W[k, b] == 1 iff bp b appears on allowed edge k
+        D = _get_gp_1D_arr_bin_var(mod, l+g)
+        get_zero_rep = ZERO_ENCODINGS[zero_enc]
+        C_bin = get_zero_rep(mod, C, C_ub)
+        Gam = _get_gp_3D_arr_int_var(mod, N, l+g, 2, Gam_ub)
+
+        _set_copy_num_constraints(mod, C, n, l, g, r)
+        H = None
+        if E_fixed is None:
+            _set_tree_constraints(mod, E, n)
+            if ancestry == 'depth':
+                H = _set_depth_constraints(mod, E, edges, N)
+            else:
+                _set_ancestry_constraints(mod, A, E, N)
+        _set_cost_constraints(mod, R, C, E, edges, n, l, g, r, c_max, w_seg)
+        _set_bp_gain_and_loss_constraints(mod, C_bin, C, W, E, edges, G, n, l, g, Gam, c_max, D, get_zero_rep)
+        _set_segment_copy_num_constraints(mod, Gam, C, Q, W, edges, m, n, l, g, r, D, c_max)
+
+        mod.setObjective(_get_objective(mod, T, R, S, lamb1, lamb2, weights), gp.GRB.MINIMIZE)
+
+        mod.params.MIPFocus = 1
+        if threads != None:
+            mod.params.Threads = threads
+
+        self.mod, self.C, self.E, self.A, self.R, self.S, self.T, self.W, self.Gam = mod, C, E, A, R, S, T, W, Gam
+        self.H, self.n, self.l_g = H, n, l_g
+        self.symmetry = symmetry and E_fixed is None  # a fixed tree has no interchangeable labels
+        self.U_constrs = []  # rows that depend on U. replaced on every call to solve
+        self.stop_reason = None  # why the last solve stopped. see _get_stop_reason
+
+    #  input: U (np.array of float) [m, 2n-1] 0 <= u_p,k <= 1. percent of sample p made by clone k
+    #         time_limit, early_term, start same as for get_C
+    #         incumbent (None or function) returns the best objective of another restart. the solve stops once its
+    #           lower bound is above it and it has a solution, with stop reason 'abandoned'
+    # output: same as get_C
+    def solve(self, U, time_limit=None, early_term=False, start=None, incumbent=None):
+        mod, C, E, A, R, W = self.mod, self.C, self.E, self.A, self.R, self.W
+
+        for constr in self.U_constrs:
+            mod.remove(constr)
+        self.U_constrs = _set_unmixing_error(mod, self.T, self.F_phasing, U, C) + \
+                         _set_bpf_penalty(mod, self.S, self.Pi, U, C, self.Gam)
+        if self.symmetry:
+            self.U_constrs += _set_symmetry_constraints(mod, C, A, self.H, U, self.n, self.l_g)
+
+        if time_limit != None:
+            mod.params.TimeLimit = time_limit
+
+        if start is not None:
+            if self.symmetry:  # a start from an earlier U may break the rows of this U
+                start = _get_canonical_start(start, U, self.n, self.l_g)
+            _set_start(C, E, A, R, W, self.edges, *start)
+
+        policy = _get_stop_policy(early_term)
+        mod.params.MIPGap = DEFAULT_MIP_GAP if policy.gap == None else policy.gap
+        mod.params.BestObjStop = -GRB.INFINITY if policy.target_obj == None else policy.target_obj
 
-    C = _get_gp_arr_int_var(mod, N, l + g + 2*r, c_max)  ### xf: C becomes N*(l+2r)
-    E = _get_gp_arr_bin_var(mod, N, N)
-    A = _get_gp_arr_bin_var(mod, N, N)  # ancestry matrix
-    R = _get_gp_arr_int_var(mod, N, N, c_max * 2*r)  # rho. cost across each edge ### xf: R also doubles because there is a cost for both alleles
-    S = _get_gp_arr_cnt_var(mod, m, l+g, c_max)  # ess. bpf penalty for each bp in each sample
-    W = _get_gp_3D_arr_bin_var(mod, N, N, l+g)
-    D = _get_gp_1D_arr_bin_var(mod, l+g)
-    C_bin = _get_bin_rep(mod, C, c_max)
-    Gam = _get_gp_3D_arr_int_var(mod, N, l+g, 2, c_max)
-
-    F_seg = (F_phasing[:, l_g:-r] + F_phasing[:, -r:]).dot(np.transpose(Q))  # [m, l] mixed copy number of segment containing breakpoint
-    Pi = np_divide_0(F_phasing[:, :l_g], F_seg)  # [m, l] expected bpf (ratio of bp copy num to segment copy num)
-
-    _set_copy_num_constraints(mod, C, n, l, g, r)
-    _set_tree_constraints(mod, E, n)
-    _set_ancestry_constraints(mod, A, E, N)
-    _set_cost_constraints(mod, R, C, E, n, l, g, r, c_max)
-    _set_bp_gain_and_loss_constraints(mod, C_bin, C, W, E, G, n, l, g, Gam, c_max, D)
-    _set_segment_copy_num_constraints(mod, Gam, C, Q, W, m, n, l, g, r, D, c_max)
-    _set_bpf_penalty(mod, S, Pi, U, C, Gam)
-
-    mod.setObjective(_get_objective(mod, F_phasing, U, C, R, S, lamb1, lamb2), gp.GRB.MINIMIZE)
-
-    mod.params.MIPFocus = 1
-    if time_limit != None:
-        mod.params.TimeLimit = time_limit
-
-    # Adding a section that early terminates 
-    if early_term:
         def cb(model, where):
-            
-            
-            if where == GRB.Callback.MIP:
+            if preempted() and model._stop_reason != 'preempted':  # SIGTERM. stop with the best solution so far
+                model._stop_reason = 'preempted'
+                model.terminate()
+
+            if where == GRB.Callback.MIPSOL and model._first_incumbent is None:
+                model._first_incumbent = model.cbGet(GRB.Callback.RUNTIME)
+
+            # stop a restart that can no longer beat the best finished restart
+            if incumbent is not None and where == GRB.Callback.MIP and time.time() - model._polled > INCUMBENT_POLL:
+                model._polled = time.time()
+                if model.cbGet(GRB.Callback.MIP_SOLCNT) > 0 and model.cbGet(GRB.Callback.MIP_OBJBND) > incumbent():
+                    model._stop_reason = 'abandoned'
+                    model.terminate()
+
+            # Adding a section that early terminates
+            if policy.stall_time != None and where == GRB.Callback.MIP:
                 runtime = model.cbGet(GRB.Callback.RUNTIME)
                 objbst = model.cbGet(GRB.Callback.MIP_OBJBST)
                 objbnd = model.cbGet(GRB.Callback.MIP_OBJBND)
@@ -188,40 +571,173 @@ def get_C(F_phasing, U, Q, G, A, H, n, c_max, lamb1, lamb2, time_limit=None, ear
 
 
                 # Has objective or gap changed?
-                if abs(objbst - model._cur_obj) > 1e-8 or abs(gap - model._gap) > 2e-2:
+                if abs(objbst - model._cur_obj) > 1e-8 or abs(gap - model._gap) > STALL_GAP:
                     # If so, update incumbent and time
                     model._cur_obj = objbst
                     model._gap = gap
                     model._time = time.time()
 
-                # Terminate if objective has not improved in 100s
-                if time.time() - model._time > 10 and runtime > 100:
-                    print("Early termination trigger, no change in model objective for over 10 seconds. Code has run for at least 100 seconds, and metrics are not changing.")
+                # Terminate if objective has not improved in stall_time seconds
+                if time.time() - model._time > policy.stall_time and runtime > policy.min_runtime:
+                    print("Early termination trigger, no change in model objective for over %g seconds. Code has run for at least %g seconds, and metrics are not changing." % (policy.stall_time, policy.min_runtime))
+                    model._stop_reason = 'stagnation'
                     model.terminate()
 
 
         mod._cur_obj = float('inf')
         mod._time = time.time()
         mod._gap = float('inf')
+        mod._first_incumbent = None
+        mod._polled = 0.0
+        mod._stop_reason = None
         mod.optimize(callback=cb)
-    else:
-        mod.optimize()
-
-    C = _as_solved(C)
-    E = _as_solved(E)
-    R = _as_solved(R)
-    A = _as_solved(A)
-    W_node_sv = np.zeros((N, l), dtype=int)
-    W_node_snv = np.zeros((N, g), dtype=int)
-    W_node = np.zeros((N, l+g), dtype=int)
-    for j in range(0, N):
-        for b in range(0, l):
-            W_node_sv[j, b] = sum([int(W[i, j, b].X) for i in range(0, N)])
-        for b in range(0, g):
-            W_node_snv[j, b] = sum([int(W[i, j, l+b].X) for i in range(0, N)])
-        for b in range(0, l+g):
-            W_node[j, b] = sum([int(W[i, j, b].X) for i in range(0, N)])
-    return mod.objVal, C, E, A, R, W_node, W_node_sv, W_node_snv, None
+        self.stop_reason = _get_stop_reason(mod)
+        if mod._first_incumbent is not None:
+            print('Time to first incumbent: %.2f s' % mod._first_incumbent)
+        if mod.SolCount == 0:
+            return float('inf'), None, None, None, None, None, None, None, 'C step stopped without a solution (' + self.stop_reason + ')'
+        return self._get_solution(_as_solved, mod.objVal)
+
+    #  input: pool_size (int) number of best solutions gurobi keeps in its solution pool
+    #         U, time_limit, early_term, start same as for solve
+    # output: list of up to pool_size outputs of solve, best first
+    def solve_pool(self, U, pool_size, time_limit=None, early_term=False, start=None):
+        mod = self.mod
+        mod.params.PoolSolutions = pool_size
+        mod.params.PoolSearchMode = 2  # systematic search for the pool_size best solutions
+        try:
+            self.solve(U, time_limit, early_term, start)
+            pool = []
+            for k in range(0, mod.SolCount):
+                mod.params.SolutionNumber = k
+                pool.append(self._get_solution(_as_solved_n, mod.PoolObjVal))
+        finally:
+            mod.params.PoolSearchMode = 0
+            mod.params.PoolSolutions = 10
+        return pool
+
+    # reads a solution through get_val (_as_solved or _as_solved_n) and returns it as an output of get_C
+    def _get_solution(self, get_val, obj_val):
+        l, g, N = self.l, self.g, self.N
+        par, chd = self.edges
+        C = get_val(self.C)
+        E = get_val(self.E)
+        A = td.get_ancestry(E) if self.A is None else get_val(self.A)
+        R_edge = get_val(self.R)
+        R = np.zeros((N, N))
+        R[par, chd] = R_edge
+        W_edge = get_val(self.W).round().astype(int)
+        W_node = np.zeros((N, l+g), dtype=int)
+        np.add.at(W_node, chd, W_edge)  # a bp appearing on edge (i, j) appears at node j
+        W_node_sv = W_node[:, :l]
+        W_node_snv = W_node[:, l:]
+        return obj_val, C, E, A, R, W_node, W_node_sv, W_node_snv, None
+
+
+# best objective and visited copy number matrices shared by the restarts of unmix. store is a dict and lock a
+#   lock, from a multiprocessing.Manager when the restarts run on a pool
+class SharedIncumbent:
+    def __init__(self, store, lock):
+        self.store = store
+        self.lock = lock
+
+    # best objective of a finished restart. inf if none has finished
+    def best(self):
+        return self.store.get('best', float('inf'))
+
+    def update(self, obj_val):
+        with self.lock:
+            if obj_val < self.best():
+                self.store['best'] = obj_val
+
+    # records that restart visited C. returns False if another restart visited the same C first. C is keyed on a
+    #   sha1 digest, wide enough that two different C never share a key in practice
+    def claim(self, C, restart):
+        key = hashlib.sha1(np.rint(C).astype(int).tobytes()).hexdigest()
+        with self.lock:
+            owner = self.store.setdefault(key, restart)
+        return owner == restart
+
+
+# set by preempt(), e.g. from a SIGTERM handler. C step solves of this process stop at their next callback and
+#   coordinate descent returns its last iterate
+_preempted = False
+
+
+def preempt():
+    global _preempted
+    _preempted = True
+
+
+def preempted():
+    return _preempted
+
+
+# wall clock budget shared by the restarts, coordinate descent iterations and clone number scan of unmix. deadline
+#   is a time.time() value so a budget can be sent to pool workers. runs_after is the number of runs that will be
+#   started one after another once this one finishes and that share the same deadline
+class Budget:
+    def __init__(self, deadline, runs_after=0):
+        self.deadline = deadline
+        self.runs_after = runs_after
+
+    def remaining(self):
+        return max(0.0, self.deadline - time.time())
+
+    def expired(self):
+        return self.remaining() <= 0
+
+    # budget of a run starting now. time left by runs that finished early goes to the runs after them
+    def start_run(self):
+        return Budget(time.time() + self.remaining() / (self.runs_after + 1))
+
+    # time limit of the next of parts solves. never above time_limit or what is left. last_stop is the stop reason
+    #   of the previous solve (see _get_stop_reason). a solve that ran out of time is followed by one with
+    #   OUT_OF_TIME_SHARE equal shares, as the warm started next solve continues the same search. time left by
+    #   solves that stop early goes to the later ones through remaining()
+    def get_time_limit(self, time_limit, parts, last_stop=None):
+        remaining = self.remaining()
+        share = remaining / max(parts, 1)
+        if last_stop == 'time_limit' or (last_stop != None and last_stop.startswith('uncertified')):
+            share *= OUT_OF_TIME_SHARE
+        limit = min(max(share, MIN_SOLVE_TIME), remaining)
+        return limit if time_limit == None else min(time_limit, limit)
+
+
+# when a C step solve may stop before it proves optimality. a criterion set to None is off
+#   stall_time (float) seconds without a change in the incumbent, or in the relative gap by more than STALL_GAP
+#   min_runtime (float) seconds the solve runs before stall_time applies
+#   gap (float) relative gap at which the solve stops (gurobi MIPGap)
+#   target_obj (float) objective at or below which the solve stops (gurobi BestObjStop)
+class StopPolicy:
+    def __init__(self, stall_time=None, min_runtime=0.0, gap=None, target_obj=None):
+        self.stall_time = stall_time
+        self.min_runtime = min_runtime
+        self.gap = gap
+        self.target_obj = target_obj
+
+
+# early_term of get_C. True is the original 10 second stall after 100 seconds, False never stops early
+def _get_stop_policy(early_term):
+    if isinstance(early_term, StopPolicy):
+        return early_term
+    if early_term:
+        return StopPolicy(stall_time=10, min_runtime=100)
+    return StopPolicy()
+
+
+# returns why the last optimize of mod stopped: 'optimal', 'gap_target', 'objective_target', 'time_limit',
+#   'stagnation', 'abandoned' or 'status_<gurobi status>'
+def _get_stop_reason(mod):
+    if mod._stop_reason != None:
+        return mod._stop_reason
+    if mod.Status == GRB.TIME_LIMIT:
+        return 'time_limit'
+    if mod.Status == GRB.USER_OBJ_LIMIT:
+        return 'objective_target'
+    if mod.Status == GRB.OPTIMAL:
+        return 'optimal' if mod.MIPGap <= DEFAULT_MIP_GAP else 'gap_target'
+    return 'status_' + str(mod.Status)
 
 
 
@@ -230,138 +746,182 @@ def get_C(F_phasing, U, Q, G, A, H, n, c_max, lamb1, lamb2, time_limit=None, ear
 # # # # # # # # # # # # # # # # # # # # # #
 
 def _set_copy_num_constraints(mod, C, n, l, g, r):
-    for b in range(0, l + g):
-        mod.addConstr(C[2 * n - 2, b], gp.GRB.EQUAL, 0)  # bp has copy number 0 at root
-    for s in range(l + g, l + g + 2*r):
-        mod.addConstr(C[2 * n - 2, s], gp.GRB.EQUAL, 1)  # seg has copy number 2 at root  ### xf: after phasing, both alleles have 1 copy
+    mod.addConstr(C[2 * n - 2, :l + g] == 0)  # bp has copy number 0 at root
+    mod.addConstr(C[2 * n - 2, l + g:l + g + 2*r] == 1)  # seg has copy number 2 at root  ### xf: after phasing, both alleles have 1 copy
 
 
+# no outgoing edges from leaves, no edges from descendents to root and no self edges are upper bounds of E
 def _set_tree_constraints(mod, E, n):
     N = 2 * n - 1
-    for i in range(0, n):
-        for j in range(0, N):
-            mod.addConstr(E[i, j] == 0)  # no outgoing edges from leaves
-    for i in range(n, N):
-        mod.addConstr(E[i, N - 1] == 0)  # no edges from descendents to root
-    for i in range(n, N - 1):
-        mod.addConstr(E[i, i] == 0)  # no self edges. leaf and root already constrained
-    for i in range(n, N):
-        mod.addConstr(gp.quicksum(E[i, :]) == 2)  # internal nodes have 2 outgoing edges
-    for j in range(0, N - 1):
-        mod.addConstr(gp.quicksum(E[n:, j]) == 1)  # non root nodes have 1 incoming edge
-    for i in range(n, N):
-        for j in range(n, N):
-            mod.addConstr(E[i, j] + E[j, i] <= 1)  # no 2 node cycles
+    mod.addConstr(E[n:, :].sum(axis=1) == 2)  # internal nodes have 2 outgoing edges
+    mod.addConstr(E[n:, :N - 1].sum(axis=0) == 1)  # non root nodes have 1 incoming edge
+    mod.addConstr(E[n:, n:] + E[n:, n:].T <= 1)  # no 2 node cycles
 
 
 def _set_ancestry_constraints(mod, A, E, N):
-    for j in range(0, N - 1):
-        mod.addConstr(A[N - 1, j] == 1)  # root v_{N-1} is ancestor to all nodes
-    for i in range(0, N):
-        mod.addConstr(A[i, N - 1] == 0)  # root v_{N-1} has no ancestors
-    for i in range(0, N):
-        for j in range(0, N):
-            mod.addConstr(A[i, j] >= E[i, j])  # ancestor if parent
-            for g in range(0, N):
-                if g != i:
-                    mod.addConstr(A[g, j] >= E[i, j] + A[g, i] - 1)  # v_j gets v_i's ancestor profile except a_{i,j}
-                    mod.addConstr(A[g, j] <= 1 - E[i, j] + A[g, i])
-    for i in range(0, N):
-        for j in range(0, N):
-            mod.addConstr(A[i, j] + A[j, i] <= 1)
-    for i in range(0, N):
-        mod.addConstr(A[i, i] == 0)
-
-def _set_cost_constraints(mod, R, C, E, n, l, g, r, c_max):
+    nodes = np.arange(0, N)
+    mod.addConstr(A[N - 1, :N - 1] == 1)  # root v_{N-1} is ancestor to all nodes
+    mod.addConstr(A[:, N - 1] == 0)  # root v_{N-1} has no ancestors
+    mod.addConstr(A >= E)  # ancestor if parent
+    for g in range(0, N):
+        I = nodes[nodes != g]  # every parent v_i other than v_g. rows are i, cols are j
+        mod.addConstr(A[g:g + 1, :] >= E[I, :] + A[g, I].reshape(-1, 1) - 1)  # v_j gets v_i's ancestor profile except a_{i,j}
+        mod.addConstr(A[g:g + 1, :] <= 1 - E[I, :] + A[g, I].reshape(-1, 1))
+    mod.addConstr(A + A.T <= 1)
+    mod.addConstr(A[nodes, nodes] == 0)
+
+# compact alternative to _set_ancestry_constraints. depth labels h_j with h_j >= h_i + 1 on every used edge
+#   rule out cycles, so together with the tree constraints E is a tree rooted at v_{N-1}. one row per allowed edge
+def _set_depth_constraints(mod, E, edges, N):
+    par, chd = edges
+    H = mod.addMVar((N,), lb=0, ub=N - 1, vtype=gp.GRB.CONTINUOUS)  # depth of each node
+    mod.addConstr(H[N - 1] == 0)  # root v_{N-1} has depth 0
+    mod.addConstr(H[chd] >= H[par] + 1 - N * (1 - E[par, chd]))
+    return H
+
+# with U fixed two nodes are only interchangeable if they have the same column of U and are both leaves or both
+#   non root internal nodes. this holds for every internal node with only_leaf and for all clones of zero frequency.
+#   within each such class, relabeling by a key gives an equivalent solution, so one canonical labeling is kept:
+#   leaves in order of total segment copy number and internal nodes in order of depth, ancestors first (A if
+#   given, else depth labels H). returns the added constraints so they can be removed when U changes
+def _set_symmetry_constraints(mod, C, A, H, U, n, l_g):
+    constrs = []
+    for members in _get_symmetry_classes(U, n):
+        for i, j in zip(members[:-1], members[1:]):
+            if j < n:
+                constrs.append(mod.addConstr(C[i, l_g:].sum() <= C[j, l_g:].sum()))
+            elif A is not None:
+                constrs.append(mod.addConstr(A[j, members[members < j]] == 0))  # no later label is an ancestor
+            elif H is not None:
+                constrs.append(mod.addConstr(H[i] <= H[j]))
+    return constrs
+
+# returns the interchangeable classes of _set_symmetry_constraints with more than one node, each as ascending labels
+def _get_symmetry_classes(U, n):
     N = 2 * n - 1
-    X1 = _get_gp_3D_arr_int_var(mod, N, N, r, c_max)
-    X2 = _get_gp_3D_arr_int_var(mod, N, N, r, c_max)
-    for i in range(0, N):
-        for j in range(0, N):  # no cost if no edge exists
-            for s in range(0, r):  # cost is difference between copy number  ### xf: change the copy numbers
-                mod.addConstr(X1[i, j, s] <= c_max * E[i, j])
-                mod.addConstr(X1[i, j, s] >= C[i, s + l + g] - C[j, s + l + g] - (c_max + 1) * (1 - E[i, j]))
-                mod.addConstr(X1[i, j, s] >= -1 * (C[i, s + l + g] - C[j, s + l + g]) - (c_max + 1) * (1 - E[i, j]))
-                mod.addConstr(X2[i, j, s] <= c_max * E[i, j])
-                mod.addConstr(X2[i, j, s] >= C[i, s + l + g + r] - C[j, s + l + g + r] - (c_max + 1) * (1 - E[i, j]))
-                mod.addConstr(X2[i, j, s] >= -1 * (C[i, s + l + g + r] - C[j, s + l + g + r]) - (c_max + 1) * (1 - E[i, j]))
-            mod.addConstr(R[i, j] == (gp.quicksum(X1[i, j, :]) + gp.quicksum(X2[i, j, :])))
+    classes = []
+    for nodes in [np.arange(0, n), np.arange(n, N - 1)]:
+        _, cls = np.unique(U[:, nodes].T.round(8), axis=0, return_inverse=True)
+        for c in np.unique(cls):
+            members = nodes[cls.reshape(-1) == c]
+            if len(members) > 1:
+                classes.append(members)
+    return classes
+
+# relabels a start (C, E, A, R, W_node) of get_C within each class of _get_symmetry_classes into the canonical
+#   labeling of _set_symmetry_constraints for U, so gurobi does not discard it: leaves by total segment copy number
+#   and internal nodes by depth in E. the relabeled start is the same tree with the same objective
+def _get_canonical_start(start, U, n, l_g):
+    C_start, E_start, A_start, R_start, W_start = start
+    N = 2 * n - 1
+    label = np.arange(0, N)  # label[k] is the new label of node k
+    depth = td.get_ancestry(E_start).sum(axis=0) if E_start is not None else None
+    for members in _get_symmetry_classes(U, n):
+        if members[0] < n and C_start is not None:
+            key = np.asarray(C_start, dtype=float)[members, l_g:].sum(axis=1)
+        elif members[0] >= n and depth is not None:
+            key = depth[members]
+        else:
+            continue
+        label[members[np.argsort(key, kind='stable')]] = members
+    order = np.argsort(label)  # order[k] is the node that gets label k
+
+    def relabel(X, both):
+        if X is None:
+            return None
+        X = np.asarray(X)[order]
+        return X[:, order] if both else X
+    return relabel(C_start, False), relabel(E_start, True), relabel(A_start, True), relabel(R_start, True), relabel(W_start, False)
+
+# w_seg (None or np.array of float) [2r] weight of the major then minor segment columns in the cost R
+def _set_cost_constraints(mod, R, C, E, edges, n, l, g, r, c_max, w_seg=None):
+    N = 2 * n - 1
+    K = len(edges[0])
+    X1 = _get_gp_arr_int_var(mod, K, r, c_max)
+    X2 = _get_gp_arr_int_var(mod, K, r, c_max)
+    par, chd, edge = _get_edge_selectors(N, edges, r)
+    e = edge @ E.reshape(-1)  # e_i,j repeated for every segment s
+    for X, C_seg in [(X1, C[:, l + g:l + g + r]), (X2, C[:, l + g + r:l + g + 2*r])]:
+        diff = (par - chd) @ C_seg.reshape(-1)  # C[i, s] - C[j, s]  ### xf: change the copy numbers
+        x = X.reshape(-1)
+        mod.addConstr(x <= c_max * e)  # no cost if no edge exists
+        mod.addConstr(x >= diff - (c_max + 1) * (1 - e))  # cost is difference between copy number
+        mod.addConstr(x >= -1 * diff - (c_max + 1) * (1 - e))
+    if w_seg is None:
+        w_seg = np.ones(2*r)
+    mod.addConstr(R == X1 @ w_seg[:r] + X2 @ w_seg[r:])
 
 
 ### xf: improve the constraints for SV related to CNV, replace the set_bp_appearance_constraints in add_phasing
-def _set_bp_gain_and_loss_constraints(mod, C_bin, C, W, E, G, n, l, g, Gam, c_max, D):
+def _set_bp_gain_and_loss_constraints(mod, C_bin, C, W, E, edges, G, n, l, g, Gam, c_max, D, get_zero_rep=None):
     N = 2 * n - 1
-    X = _get_gp_3D_arr_int_var(mod, N, N, l+g, 3)
-    for i in range(0, N):
-        for j in range(0, N):
-            for b in range(0, l+g):  # only 0 if copy num goes from 0 to 1 across edge (i,j)
-                mod.addConstr(X[i, j, b] == 2 + C_bin[i, b] - C_bin[j, b] - E[i, j])
-    X_bin = _get_3D_bin_rep(mod, X, 3)
-    for i in range(0, N):
-        for j in range(0, N):
-            for b in range(0, l+g):  # set W as bp appearance
-                mod.addConstr(W[i, j, b] == 1 - X_bin[i, j, b])
-            for s in range(0, l):
-                for t in range(0, l):  # breakpoint pairs appear on same edge, not include SNVs
-                    mod.addConstr(W[i, j, s] - W[i, j, t] <= 1 - G[s, t])
-                    mod.addConstr(W[i, j, s] - W[i, j, t] >= - 1 + G[s, t])
-    for b in range(0, l+g):  # breakpoints only appear once in the tree
-        mod.addConstr(gp.quicksum([W[i, j, b] for i in range(0, N) for j in range(0, N)]) == 1)
-    for i in range(0, N):
-        for j in range(0, N):
-            for b in range(0, l+g): ### xf: only set constraints to the breakpoints that are not appeared in this branch
+    K = len(edges[0])
+    par, chd, edge = _get_edge_selectors(N, edges, l+g)
+    e = edge @ E.reshape(-1)  # e_i,j repeated for every breakpoint b
+    X = _get_gp_arr_int_var(mod, K, l+g, 3)
+    # only 0 if copy num goes from 0 to 1 across edge (i,j)
+    mod.addConstr(X.reshape(-1) == 2 + (par - chd) @ C_bin[:, :l+g].reshape(-1) - e)
+    X_bin = (get_zero_rep or _get_bin_rep)(mod, X, 3)
+    mod.addConstr(W == 1 - X_bin)  # set W as bp appearance
+    # breakpoint pairs appear on same edge, not include SNVs. for non mates the pairwise rows are W_s - W_t <= 1
+    #   which always holds, and for mates they reduce to W_s == W_t, so only the mate pairs in G are generated
+    mates = np.argwhere(np.triu(G, 1))  # [num pairs, 2] breakpoint s < t with g_s,t == 1
+    if len(mates) > 0:
+        mod.addConstr(W[:, mates[:, 0]] == W[:, mates[:, 1]])
+    mod.addConstr(W.sum(axis=0) == 1)  # breakpoints only appear once in the tree
+    ### xf: only set constraints to the breakpoints that are not appeared in this branch
+    C_diff = (chd - par) @ C[:, :l+g].reshape(-1)  # C[j, b] - C[i, b]
+    d = sp.kron(np.ones((K, 1)), sp.identity(l+g), format='csr') @ D  # d_b repeated for every edge (i, j)
+    w = W.reshape(-1)
+    for k, off in [(0, 2 - e - d + w), (1, 1 - e + d + w)]:  # off is 0 only for the allele b sits on, along an edge b does not appear on
+        Gam_diff = (chd - par) @ Gam[:, :, k].reshape(-1)  # Gam[j, b, k] - Gam[i, b, k]
+        mod.addConstr(Gam_diff >= C_diff - off * (2 * c_max + 1))
+        mod.addConstr(Gam_diff <= C_diff + off * (2 * c_max + 2))
 
-                mod.addConstr(Gam[j, b, 0] - Gam[i, b, 0] >= C[j, b] - C[i, b] - (2 - E[i, j] - D[b] + W[i, j, b]) * (2 * c_max + 1))
-                mod.addConstr(Gam[j, b, 0] - Gam[i, b, 0] <= C[j, b] - C[i, b] + (2 - E[i, j] - D[b] + W[i, j, b]) * (2 * c_max + 2))
-                mod.addConstr(Gam[j, b, 1] - Gam[i, b, 1] >= C[j, b] - C[i, b] - (1 - E[i, j] + D[b] + W[i, j, b]) * (2 * c_max + 1))
-                mod.addConstr(Gam[j, b, 1] - Gam[i, b, 1] <= C[j, b] - C[i, b] + (1 - E[i, j] + D[b] + W[i, j, b]) * (2 * c_max + 2))
-                
 ### xf: _set_ancestry_condition_constraints removed 
 
-def _set_segment_copy_num_constraints(mod, Gam, C, Q, W, m, n, l, g, r, D, c_max):
+def _set_segment_copy_num_constraints(mod, Gam, C, Q, W, edges, m, n, l, g, r, D, c_max):
     N = 2 * n - 1
-    for k in range(0, N):
-        for b in range(0, l+g):  # define copy num of segment containing breakpoint
-            mod.addConstr(Gam[k, b, 0] == gp.quicksum([Q[b, s] * C[k, l + g + s] for s in range(0, r)])) ### xf: change to new Gamma and C matrix
-            mod.addConstr(Gam[k, b, 1] == gp.quicksum([Q[b, s] * C[k, l + g + s + r] for s in range(0, r)]))
-            mod.addConstr(C[k, b] <= Gam[k, b, 0] + (1 - D[b]) * c_max)  # cp num breakpoint cant exceed cp num of seg containing bp
-            mod.addConstr(C[k, b] <= Gam[k, b, 1] + D[b] * c_max)
-    for j in range(0, N):
-        for b in range(0, l+g):  # copy number of segment containing bp must be at least 1 if bp appears at node j
-            mod.addConstr(Gam[j, b, 0] + 1 - D[b] >= gp.quicksum([W[i, j, b] for i in range(0, N)]))
-            mod.addConstr(Gam[j, b, 1] + D[b] >= gp.quicksum([W[i, j, b] for i in range(0, N)]))
-
-
+    # define copy num of segment containing breakpoint ### xf: change to new Gamma and C matrix
+    mod.addConstr(Gam[:, :, 0] == C[:, l + g:l + g + r] @ Q.T)
+    mod.addConstr(Gam[:, :, 1] == C[:, l + g + r:l + g + 2*r] @ Q.T)
+    mod.addConstr(C[:, :l+g] <= Gam[:, :, 0] + (1 - D) * c_max)  # cp num breakpoint cant exceed cp num of seg containing bp
+    mod.addConstr(C[:, :l+g] <= Gam[:, :, 1] + D * c_max)
+    # copy number of segment containing bp must be at least 1 if bp appears at node j
+    K = len(edges[0])
+    into = sp.csr_matrix((np.ones(K), (edges[1], np.arange(0, K))), shape=(N, K))  # into[j, k] == 1 iff edge k ends at node j
+    W_in = sp.kron(into, sp.identity(l+g), format='csr') @ W.reshape(-1)  # flattened [N, l+g] number of times bp b appears on an edge into node j
+    d = sp.kron(np.ones((N, 1)), sp.identity(l+g), format='csr') @ D  # d_b repeated for every node j
+    mod.addConstr(Gam[:, :, 0].reshape(-1) + 1 - d >= W_in)
+    mod.addConstr(Gam[:, :, 1].reshape(-1) + d >= W_in)
+
+
+# returns the added constraints so they can be removed when U changes
 def _set_bpf_penalty(mod, S, Pi, U, C, Gam):
     m, l_g = S.shape
-    N, _, _ = Gam.shape
-    for p in range(0, m):
-        for b in range(0, l_g):
-            sg_cpnum_est = gp.quicksum([U[p, k] * (Gam[k, b, 0] + Gam[k, b, 1]) for k in range(0, N)])
-            bp_cpnum_est = gp.quicksum([U[p, k] * C[k, b] for k in range(0, N)])
-            mod.addConstr(S[p, b] == _get_abs(mod, Pi[p, b] * sg_cpnum_est - bp_cpnum_est))
+    sg_cpnum_est = U @ (Gam[:, :, 0] + Gam[:, :, 1])  # [m, l+g]
+    bp_cpnum_est = U @ C[:, :l_g]
+    return _set_abs(mod, S, Pi * sg_cpnum_est - bp_cpnum_est)
+
+
+# T is unmixing error |F - UC|. returns the added constraints so they can be removed when U changes
+def _set_unmixing_error(mod, T, F_phasing, U, C):
+    m, L = F_phasing.shape
+    f_hat = U @ C[:, :L]
+    return _set_abs(mod, T, F_phasing - f_hat)
 
 # # # # # # # # #
 #   OBJECTIVE   #
 # # # # # # # # #
 
-def _get_objective(mod, F_phasing, U, C, R, S, lamb1, lamb2):  # returns expression for objective
-    m, L = F_phasing.shape
-    N, _ = C.shape
-    _, l = S.shape
-    sums = []
-    for p in range(0, m):
-        for s in range(0, L):
-            f_hat = gp.quicksum([U[p, k] * C[k, s] for k in range(0, N)])
-            sums.append(_get_abs(mod, F_phasing[p, s] - f_hat))
-    for i in range(0, N):
-        for j in range(0, N):
-            sums.append(lamb1 * R[i, j])
-    for p in range(0, m):
-        for b in range(0, l):
-            sums.append(lamb2 * S[p, b])
+def _get_objective(mod, T, R, S, lamb1, lamb2, weights=None):  # returns expression for objective. weights are column weights of T and S
+    if weights is None:
+        sums = T.sum() + lamb1 * R.sum() + lamb2 * S.sum()
+    else:
+        _, l_g = S.shape
+        sums = (T @ weights).sum() + lamb1 * R.sum() + lamb2 * (S @ weights[:l_g]).sum()
     mod.update()
-    return gp.quicksum(sums)
+    return sums
 
 
 def _calculate_objective(F, F_phasing, U, C, R, S, lamb1, lamb2):  # returns expression for objective
@@ -395,79 +955,58 @@ def _calculate_S(S, Pi, U, C, Gam):
 #   G U R O B I   V A R I A B L E   M A K E R S   #
 # # # # # # # # # # # # # # # # # # # # # # # # # #
 
+# all makers return gp.MVar blocks so constraints can be added as batched matrix expressions
+
 def _get_gp_arr_int_var(mod, m, n, vmax=None):
-    X = np.empty((m, n), dtype=gp.Var)
-    for i in range(0, m):
-        for j in range(0, n):
-            if vmax == None:
-                X[i, j] = mod.addVar(lb=0, vtype=gp.GRB.INTEGER)
-            else:
-                X[i, j] = mod.addVar(lb=0, ub=vmax, vtype=gp.GRB.INTEGER)
-    # mod.update()
-    return X
+    if vmax is None:
+        return mod.addMVar((m, n), lb=0, vtype=gp.GRB.INTEGER)
+    return mod.addMVar((m, n), lb=0, ub=vmax, vtype=gp.GRB.INTEGER)
+
+
+def _get_gp_1D_arr_int_var(mod, m, vmax=None):
+    if vmax is None:
+        return mod.addMVar((m,), lb=0, vtype=gp.GRB.INTEGER)
+    return mod.addMVar((m,), lb=0, ub=vmax, vtype=gp.GRB.INTEGER)
 
 
 def _get_gp_1D_arr_bin_var(mod, m):
-    X = np.empty((m), dtype=gp.Var)
-    for i in range(0, m):
-        X[i] = mod.addVar(vtype=gp.GRB.BINARY)
-    # mod.update()
-    return X
+    return mod.addMVar((m,), vtype=gp.GRB.BINARY)
 
 
 def _get_gp_arr_bin_var(mod, m, n):
-    X = np.empty((m, n), dtype=gp.Var)
-    for i in range(0, m):
-        for j in range(0, n):
-            X[i, j] = mod.addVar(vtype=gp.GRB.BINARY)
-    # mod.update()
-    return X
+    return mod.addMVar((m, n), vtype=gp.GRB.BINARY)
 
 
 def _get_gp_arr_cnt_var(mod, m, n, vmax=None):
-    X = np.empty((m, n), dtype=gp.Var)
-    for i in range(0, m):
-        for j in range(0, n):
-            if vmax == None:
-                X[i, j] = mod.addVar(lb=0, vtype=gp.GRB.CONTINUOUS)
-            else:
-                X[i, j] = mod.addVar(lb=0, ub=vmax, vtype=gp.GRB.CONTINUOUS)
-    # mod.update()
-    return X
+    if vmax is None:
+        return mod.addMVar((m, n), lb=0, vtype=gp.GRB.CONTINUOUS)
+    return mod.addMVar((m, n), lb=0, ub=vmax, vtype=gp.GRB.CONTINUOUS)
 
 
 def _get_gp_3D_arr_int_var(mod, l, m, n, vmax):
-    X = np.empty((l, m, n), dtype=gp.Var)
-    for i in range(0, l):
-        for j in range(0, m):
-            for k in range(0, n):
-                if vmax == None:
-                    X[i, j, k] = mod.addVar(lb=0, vtype=gp.GRB.INTEGER)
-                else:
-                    X[i, j, k] = mod.addVar(lb=0, ub=vmax, vtype=gp.GRB.INTEGER)
-    # mod.update()
-    return X
+    if vmax is None:
+        return mod.addMVar((l, m, n), lb=0, vtype=gp.GRB.INTEGER)
+    return mod.addMVar((l, m, n), lb=0, ub=vmax, vtype=gp.GRB.INTEGER)
 
 
 def _get_gp_3D_arr_bin_var(mod, l, m, n):
-    X = np.empty((l, m, n), dtype=gp.Var)
-    for i in range(0, l):
-        for j in range(0, m):
-            for k in range(0, n):
-                X[i, j, k] = mod.addVar(vtype=gp.GRB.BINARY)
-    # mod.update()
-    return X
+    return mod.addMVar((l, m, n), vtype=gp.GRB.BINARY)
 
 
+# x is an expression of any shape. returns continuous vars of the same shape with x_abs >= |x|
 def _get_abs(mod, x):
-    x_abs = mod.addVar(vtype=gp.GRB.CONTINUOUS)
+    x_abs = mod.addMVar(x.shape, vtype=gp.GRB.CONTINUOUS)
     # mod.update() # <- removing this drastically speeds up solver
     #mod.addConstr(x_abs == gp.abs_(x))
-    mod.addConstr(x_abs, gp.GRB.GREATER_EQUAL, x)
-    mod.addConstr(x_abs, gp.GRB.GREATER_EQUAL, -1 * x)
+    _set_abs(mod, x_abs, x)
     return x_abs
 
 
+# constrains existing vars x_abs >= |x|. returns the added constraints
+def _set_abs(mod, x_abs, x):
+    return [mod.addConstr(x_abs >= x), mod.addConstr(x_abs >= -1 * x)]
+
+
 def _get_sgn(mod, x, lb, ub): ###xf: when b=0, x<=0, when b=1, x>=1
     b = mod.addVar(vtype=gp.GRB.BINARY)
     mod.addConstr(lb * (1-b) <= x)
@@ -482,38 +1021,90 @@ def _get_consensus_sgn(mod, x1, x2, lb, ub):
     return con
 
 
+# X is an integer MVar of any shape with entries in [0, vmax]. returns binary Y of the same shape
 def _get_bin_rep(mod, X, vmax):
-    m, n = X.shape
-    Y = _get_gp_arr_bin_var(mod, m, n)  # Y = 0 if X == 0. Y = 1 if X != 0
-    num_bits = int(math.floor(math.log(vmax, 2))) + 1  # maximum number of bits required
-    Z = _get_gp_3D_arr_bin_var(mod, m, n, num_bits)  # bit representation of X
-    for i in range(0, m):
-        for j in range(0, n):  # set Z as bit representation
-            mod.addConstr(gp.quicksum([Z[i, j, b] * 2 ** b for b in range(0, num_bits)]) == X[i, j])
-            for b in range(0, num_bits):  # Y must be 1 if any bits are 1
-                mod.addConstr(Z[i, j, b] <= Y[i, j])  # Y must be 0 if all bits are 0
-            mod.addConstr(Y[i, j] <= gp.quicksum([Z[i, j, b] for b in range(0, num_bits)]))
+    Y = mod.addMVar(X.shape, vtype=gp.GRB.BINARY)  # Y = 0 if X == 0. Y = 1 if X != 0
+    num_bits = int(math.floor(math.log(max(np.max(vmax), 1), 2))) + 1  # maximum number of bits required
+    bit_ub = (2 ** np.arange(0, num_bits) <= np.asarray(vmax)[..., None]).astype(float)  # vmax may be per entry. higher bits are 0
+    Z = mod.addMVar(X.shape + (num_bits,), ub=np.broadcast_to(bit_ub, X.shape + (num_bits,)), vtype=gp.GRB.BINARY)  # bit representation of X
+    last = len(X.shape)  # axis of Z holding the bits
+    mod.addConstr((Z * (2 ** np.arange(0, num_bits))).sum(axis=last) == X)  # set Z as bit representation
+    mod.addConstr(Z <= Y.reshape(X.shape + (1,)))  # Y must be 1 if any bits are 1
+    mod.addConstr(Y <= Z.sum(axis=last))  # Y must be 0 if all bits are 0
     return Y
 
 
-def _get_3D_bin_rep(mod, X, vmax):
-    l, m, n = X.shape
-    Y = _get_gp_3D_arr_bin_var(mod, l, m, n)  # Y = 0 if X == 0. Y = 1 if X != 0
-    for i in range(0, l):
-        Y[i, :, :] = _get_bin_rep(mod, X[i, :, :], vmax)
+# same contract as _get_bin_rep without bit variables. since X is integer in [0, vmax], X <= vmax * Y forces
+#   X == 0 when Y == 0 and X >= Y forces X >= 1 when Y == 1
+def _get_bigm_rep(mod, X, vmax):
+    Y = mod.addMVar(X.shape, vtype=gp.GRB.BINARY)  # Y = 0 if X == 0. Y = 1 if X != 0
+    mod.addConstr(X <= vmax * Y)
+    mod.addConstr(X >= Y)
     return Y
 
 
-# returns numpy array of solved values
-def _as_solved(X):
-    m, n = X.shape
-    Y = np.empty((m, n))
-    for i in range(0, m):
-        for j in range(0, n):
-            Y[i, j] = X[i, j].X
+# same contract as _get_bin_rep using indicator constraints Y == 0 -> X == 0 and Y == 1 -> X >= 1
+def _get_indicator_rep(mod, X, vmax):
+    Y = mod.addMVar(X.shape, vtype=gp.GRB.BINARY)  # Y = 0 if X == 0. Y = 1 if X != 0
+    for y, x in zip(Y.reshape(-1).tolist(), X.reshape(-1).tolist()):
+        mod.addGenConstrIndicator(y, False, x, gp.GRB.EQUAL, 0.0)
+        mod.addGenConstrIndicator(y, True, x, gp.GRB.GREATER_EQUAL, 1.0)
     return Y
 
 
+# zero_enc option of get_C to maker of the zero/non-zero indicators
+ZERO_ENCODINGS = {'bits': _get_bin_rep, 'bigm': _get_bigm_rep, 'indicator': _get_indicator_rep}
+
+
+# mask [N, N] of the edges a tree can have. only internal nodes (and root) have children, nothing points to
+#   the root and there are no self edges
+def _get_edge_mask(n):
+    N = 2 * n - 1
+    mask = np.zeros((N, N))
+    mask[n:, :N - 1] = 1
+    mask[np.arange(n, N - 1), np.arange(n, N - 1)] = 0
+    return mask
+
+
+# sparse selectors for the flattened [K, k] edge tensors over the K allowed edges (parents, children). row (e, s)
+# of par picks [i_e, s] and of chd picks [j_e, s] from a flattened [N, k] block. row (e, s) of edge picks
+# [i_e, j_e] from a flattened [N, N] block
+def _get_edge_selectors(N, edges, k):
+    parents, children = edges
+    K = len(parents)
+    rows = np.arange(0, K)
+    ones_K = np.ones(K)
+    I_k = sp.identity(k, format='csr')
+    par = sp.kron(sp.csr_matrix((ones_K, (rows, parents)), shape=(K, N)), I_k, format='csr')
+    chd = sp.kron(sp.csr_matrix((ones_K, (rows, children)), shape=(K, N)), I_k, format='csr')
+    flat = sp.csr_matrix((ones_K, (rows, parents * N + children)), shape=(K, N * N))
+    edge = sp.kron(flat, np.ones((k, 1)), format='csr')
+    return par, chd, edge
+
+
+# sets the MIP start of C, E, A, R and W from arrays of solved values. R [N, N] and W_node [N, l+g] are read
+#   over the allowed edges since a breakpoint appearing at node j appears on the single edge into j
+def _set_start(C, E, A, R, W, edges, C_start, E_start, A_start, R_start, W_start):
+    par, chd = edges
+    for X, X_start in [(C, C_start), (E, E_start), (A, A_start)]:
+        if X is not None and X_start is not None:
+            X.Start = X_start
+    if R_start is not None:
+        R.Start = R_start[par, chd]
+    if W_start is not None and E_start is not None:
+        W.Start = E_start[par, chd][:, None] * W_start[chd, :]
+
+
+# returns numpy array of solved values. reads the whole MVar block in one call
+def _as_solved(X):
+    return np.array(X.X, dtype=float)
+
+
+# returns numpy array of the values of X in pool solution SolutionNumber
+def _as_solved_n(X):
+    return np.array(X.Xn, dtype=float)
+
+
 # # # # # # # # # # # # # # # # # # # #
 #   H E L P E R   F U N C T I O N S   #
 # # # # # # # # # # # # # # # # # # # #
@@ -527,6 +1118,145 @@ def gen_U(m, n):
     return U
 
 
+#  input: F (np.array of float) [m, l+g+2r] mixed copy number f_p,s of mutation s in sample p
+#         Q (np.array of 0 or 1) [l+g, r] q_b,s == 1 if breakpoint b is in segment s. 0 otherwise
+#         n (int) number of leaves in phylogeny. 2n-1 is total number of nodes
+#         only_leaf (boolean) internal nodes get zero frequency
+#         restart (int) index of the restart asking for a starting U
+# output: U (np.array of float) [m, 2n-1] 0 <= u_p,k <= 1. starting U for this restart
+#  notes: the segment columns are factored as F ~ U C with nonnegative U and C, where the root row of C is held at
+#         the normal copy number 1. U_INIT_CANDIDATES factorizations from different random starts are made with a
+#         seed taken from F so that every restart process sees the same candidates. restart 0 gets the best fit
+#         and restart i the candidate farthest from the first i picks. restarts past the candidates, or past the
+#         distinct candidates once every one left equals a pick, use gen_U
+def gen_U_init(F_phasing, Q, n, only_leaf=False, restart=0):
+    m = len(F_phasing)
+    l_g, _ = Q.shape
+    if restart >= U_INIT_CANDIDATES:
+        return gen_U(m, n)
+    F_seg = F_phasing[:, l_g:]
+    rng = np.random.RandomState(zlib.crc32(F_seg.tobytes()))
+    candidates = [ _factor_U(F_seg, n, only_leaf, rng) for _ in range(0, U_INIT_CANDIDATES) ]
+    candidates.sort(key = lambda cand: cand[1])
+
+    # clone labels are arbitrary, so candidates are compared by their sorted rows
+    profiles = [ np.sort(U, axis = 1) for U, _ in candidates ]
+    picked = [0]
+    dist = np.array([ np.abs(prof - profiles[0]).sum() for prof in profiles ])
+    while len(picked) <= restart and dist.max() > 0:  # identical candidates are never picked twice
+        i = int(dist.argmax())
+        picked.append(i)
+        dist = np.minimum(dist, [ np.abs(prof - profiles[i]).sum() for prof in profiles ])
+    if restart >= len(picked):
+        return gen_U(m, n)
+    return candidates[picked[restart]][0]
+
+
+# nonnegative factorization F_seg ~ U C by multiplicative updates from a random start. returns (U, error)
+def _factor_U(F_seg, n, only_leaf, rng):
+    m, k = F_seg.shape
+    N = 2 * n - 1
+    clones = list(range(0, n)) + [N - 1] if only_leaf else list(range(0, N))
+    U = rng.rand(m, len(clones))
+    C = rng.rand(len(clones), k) * max(F_seg.max(), 1.0)
+    C[-1, :] = 1.0  # root is normal
+    for _ in range(0, NMF_ITERS):
+        U *= np_divide_0(F_seg.dot(C.T), U.dot(C).dot(C.T))
+        U = np_divide_0(U, U.sum(axis = 1)[:, None])  # frequencies sum to 1
+        C[:-1, :] *= np_divide_0(U.T.dot(F_seg), U.T.dot(U).dot(C))[:-1, :]
+    U_all = np.zeros((m, N))
+    U_all[:, clones] = U
+    U_all[U_all.sum(axis = 1) == 0, N - 1] = 1.0
+    return U_all, np.abs(F_seg - U.dot(C)).sum()
+
+
+#  input: F (np.array of float) [m, l+g+2r] mixed copy number f_p,s of mutation s in sample p
+#         U, C, E, W_node output of get_UCE for n leaves
+# output: init (tuple) (C, E, A, R, W_node) for n+1 leaves to pass to get_UCE as init
+#  notes: the leaf whose samples fit worst (unmixing error weighted by its frequency) is replaced by a new internal
+#         node n+1 with children the old leaf and the new leaf n, both with its copy numbers. breakpoints that
+#         appeared at the old leaf appear at the new internal node. old internal nodes move up two labels
+def split_worst_leaf(F_phasing, U, C, E, W_node, n):
+    m, L = F_phasing.shape
+    N = 2 * n - 1
+    l_g = W_node.shape[1]
+    E = np.rint(E).astype(int)
+    resid = np.abs(F_phasing - U.dot(C[:, :L])).sum(axis=1)  # [m] unmixing error of each sample
+    worst = int(U[:, :n].T.dot(resid).argmax())
+
+    leaf, x = n, n + 1
+    relabel = np.concatenate([np.arange(0, n), np.arange(n + 2, N + 2)])  # old label to new label
+    E_new = np.zeros((N + 2, N + 2), dtype=int)
+    E_new[np.ix_(relabel, relabel)] = E
+    p = relabel[np.where(E[:, worst] == 1)[0][0]]
+    E_new[p, worst] = 0
+    E_new[p, x], E_new[x, worst], E_new[x, leaf] = 1, 1, 1
+
+    C_new = np.zeros((N + 2, C.shape[1]))
+    C_new[relabel] = C
+    C_new[x] = C[worst]
+    C_new[leaf] = C[worst]
+    W_new = np.zeros((N + 2, l_g), dtype=int)
+    W_new[relabel] = W_node
+    W_new[x] = W_node[worst]
+    W_new[worst] = 0
+    return C_new, E_new, td.get_ancestry(E_new), td.get_R(C_new[:, l_g:], E_new), W_new
+
+
+#  input: F (np.array of float) [m, l+g+2r] mixed copy number f_p,s of mutation s in sample p
+#         Q (np.array of 0 or 1) [l+g, r] q_b,s == 1 if breakpoint b is in segment s. 0 otherwise
+#         n (int) number of leaves in phylogeny. 2n-1 is total number of nodes
+#         c_max (int) maximum allowed copy number for any element in output C
+#         slack (int) copies allowed above the largest mixed copy number of a segment column
+#         fix_tol (float or None) segment columns within fix_tol of 1 in every sample are fixed at 1. None fixes none
+# output: C_lb (np.array of int) [2n-1, l+g+2r] lower bound of each entry of C
+#         C_ub (np.array of int) [2n-1, l+g+2r] upper bound of each entry of C
+#         fixed (np.array of bool) [l+g+2r] columns whose C is fixed outright
+#  notes: a segment allele is bounded by its largest mixed copy number over the samples plus slack. this is a
+#         data driven bound, not a proof. a clone can hold more copies than any mixture shows, so the bound can cut
+#         off the true optimum. fixing columns near 1 is a further heuristic and is off unless fix_tol is given. a breakpoint sits on one allele of its
+#         segment (Q) so it gets the larger bound of the two alleles. the root row is fixed as in
+#         _set_copy_num_constraints
+def get_C_bounds(F_phasing, Q, n, c_max, slack=BOUND_SLACK, fix_tol=None):
+    l_g, r = Q.shape
+    N = 2 * n - 1
+    F_seg = F_phasing[:, l_g:l_g + 2*r]
+    seg_ub = np.clip(np.ceil(F_seg.max(axis=0)).astype(int) + slack, 1, c_max)  # [2r] root has copy number 1
+    bp_seg = Q.argmax(axis=1)
+    bp_ub = np.maximum(seg_ub[bp_seg], seg_ub[bp_seg + r])
+    fixed = np.zeros(l_g + 2*r, dtype=bool)
+    if fix_tol != None:
+        fixed[l_g:] = (np.abs(F_seg - 1) <= fix_tol).all(axis=0)
+
+    C_lb = np.zeros((N, l_g + 2*r), dtype=int)
+    C_ub = np.tile(np.concatenate([bp_ub, seg_ub]), (N, 1))
+    C_lb[:, fixed], C_ub[:, fixed] = 1, 1
+    C_ub[N - 1, :l_g] = 0  # bp has copy number 0 at root
+    C_lb[N - 1, l_g:], C_ub[N - 1, l_g:] = 1, 1  # seg has copy number 1 per allele at root
+    return C_lb, C_ub, fixed
+
+
+# cheap MIP start for the first coordinate descent iteration. a caterpillar tree where internal node k has
+#   leaf (N-1-k) and the next internal node as children, and every clone keeps the root copy numbers for
+#   segments. breakpoint copy numbers and W are left GRB.UNDEFINED for gurobi to complete
+def gen_start(n, l, g, r):
+    N = 2 * n - 1
+    E = np.zeros((N, N))
+    internals = list(range(N - 1, n - 1, -1))
+    for idx, k in enumerate(internals):
+        if idx < len(internals) - 1:
+            E[k, idx] = 1
+            E[k, internals[idx + 1]] = 1
+        else:
+            E[k, idx] = 1
+            E[k, idx + 1] = 1
+    A = td.get_ancestry(E)
+    C = np.full((N, l + g + 2*r), GRB.UNDEFINED)
+    C[N - 1, :l + g] = 0
+    C[:, l + g:] = 1
+    return C, E, A, None, None
+
+
 def printnow(s):
     sys.stdout.write(s)
     sys.stdout.flush()
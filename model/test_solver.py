@@ -1,8 +1,16 @@
-import solver as sv
-import random
 import sys
+import os
+import time
+import random
 import numpy as np
 
+import solver as sv
+import tree_dp as td
+import tree_search as ts
+import compress as cp
+sys.path.insert(0, '../help/')
+import generate_matrices as gm
+
 def printnow(s):
 	sys.stdout.write(s)
 	sys.stdout.flush()
@@ -29,11 +37,32 @@ def main(argv):
 	lamb2 = 1.0
 	lamb2 = 0.25
 
+	if 'benchmark' in argv:
+		benchmark_ancestry(F, Q, G, A, H, c_max, lamb1, lamb2)
+		return
+	if 'benchmark_symmetry' in argv:
+		benchmark_symmetry(F, Q, G, c_max, lamb1, lamb2)
+		return
+	if 'benchmark_zero' in argv:
+		benchmark_zero_encoding(argv[argv.index('benchmark_zero') + 1:], c_max, lamb1, lamb2)
+		return
+
 	test_get_U(F, n, l, r)
+	test_get_U_highs(m, n, l, r)
+	test_gen_U_init(F, Q, n)
 	test_get_C(F, Q, G, A, H, n, c_max, lamb1, lamb2)
+	test_get_C_tree(F, Q, G, n, c_max, lamb1, lamb2)
+	test_get_pool_starts(F, Q, G, n, c_max, lamb1, lamb2)
+	test_tight_bounds(c_max)
+	test_tight_bounds(c_max, n = 3)
+	test_fix_tol(c_max)
+	test_compress_segments(c_max, lamb1, lamb2)
+	test_compress_snvs(F, Q, n)
+	test_sample_informative()
 	test_get_UCE(F, Q, G, A, H, n, c_max, lamb1, lamb2, max_iters = 2)
+	test_get_UCE_fast(c_max)
 
-# mixed copy number
+# phased mixed copy number [m, l+2r]. each segment is split evenly between its two alleles
 def gen_F(Q, m, l, r, f_scale):
 	h_scale = float(f_scale) / 2.0 # scale for breakpoints
 	F = h_scale * np.random.rand(m, l + r)
@@ -43,14 +72,14 @@ def gen_F(Q, m, l, r, f_scale):
 				for p in range(0, m):
 					F[p, l+s] = max(F[p, l+s], F[p, b])
 					F[p, l+s] += h_scale * np.random.rand()
-	return F
+	return np.concatenate([F[:, :l], F[:, l:] / 2, F[:, l:] / 2], axis = 1)
 
 # mated pair binary matrix
 def gen_G(l):
 	G = np.zeros((l, l))
 	I = [ x for x in range(0, l) ]   # list of all indicies
 	random.shuffle(I)                 # randomly permut to make random pairs
-	I = np.array(I).reshape((l/2, 2)) # make a l/2 by 2 numpy array of mated pairs
+	I = np.array(I).reshape((l//2, 2)) # make a l/2 by 2 numpy array of mated pairs
 	for i, j in I:
 		G[i, j] = 1
 		G[j, i] = 1
@@ -59,10 +88,10 @@ def gen_G(l):
 	return G
 
 def gen_C(n, l, r):
-	C = np.random.rand(2*n-1, l+r)
+	C = np.random.rand(2*n-1, l+2*r)
 	C = (C * 4).round()
 	C[2*n-2, :l] = 0
-	C[2*n-2, l:] = 2
+	C[2*n-2, l:] = 1
 	return C
 
 # generate random U matrix
@@ -79,32 +108,261 @@ def gen_U(m, n):
 
 def test_get_UCE(F, Q, G, A, H, n, c_max, lamb1, lamb2, max_iters = 5, timelimit = 10):
 	printnow('\ntest_get_UCE starting\n')
-	U, C, E, R, W, obj_val, err_msg = sv.get_UCE(F, Q, G, A, H, n, c_max, lamb1, lamb2, max_iters, timelimit)
+	policy = sv.StopPolicy(stall_time = 5, gap = 1e-2)
+	U, C, E, A, R, W, W_sv, W_snv, obj_val, err_msg, metrics = sv.get_UCE(F, Q, G, A, H, n, c_max, lamb1, lamb2, max_iters, timelimit, stop_policy = policy)
 
 	_print_results(err_msg, U, C, E, R, W, obj_val)
+	printnow('metrics:\t' + str(metrics) + '\n')
 
 	printnow('\ntest_get_UCE complete\n')
 
+# fast mode end to end on a tiny phased instance. no MIP is solved
+def test_get_UCE_fast(c_max, n = 3, m = 2, l = 2, r = 3, num_moves = 10):
+	printnow('\ntest_get_UCE_fast starting\n')
+	Q = np.zeros((l, r), dtype = int)
+	Q[0, 0], Q[1, 1] = 1, 1
+	G = np.ones((l, l))  # breakpoints 0 and 1 are mates
+	F = 3 * np.random.rand(m, l + 2*r)
+	U, C, E, A, R, W, W_sv, W_snv, obj_val, err_msg, metrics = ts.get_UCE_fast(F, Q, G, None, None, n, c_max, 0.1, 0.1, 2, num_moves = num_moves)
+	_print_results(err_msg, U, C, E, R, W, obj_val)
+	printnow('metrics:\t' + str(metrics) + '\n')
+	assert err_msg == None and C.shape == (2*n-1, l + 2*r) and metrics['iterations'] == num_moves
+	printnow('test_get_UCE_fast complete\n')
+
 def test_get_U(F, n, l, r):
 	N = 2*n-1
 	C = gen_C(n, l, r)
 	printnow('\ntest_get_U starting\n')
-	U = sv.get_U(F, C, n)
+	U = sv.get_U(F, C, n, None, None, l, False)
 	printnow('U:\t' + str(U) + '\n')
 	printnow('test_get_U complete\n')
 
+# U is recovered exactly when F is an exact mixture of C
+def test_get_U_highs(m, n, l, r):
+	C = gen_C(n, l, r)
+	U = gen_U(m, n)
+	F = U.dot(C)
+	printnow('\ntest_get_U_highs starting\n')
+	U_highs, err_msg = sv.get_U_highs(F, C, n, None, None, l, False, threads = 2)
+	assert err_msg == None, err_msg
+	printnow('U:\t' + str(U_highs) + '\n')
+	printnow('unmixing error:\t' + str(np.abs(F - U_highs.dot(C)).sum()) + '\n')
+	printnow('test_get_U_highs complete\n')
+
+# restarts get different starting U and the same restart always gets the same one
+def test_gen_U_init(F, Q, n):
+	printnow('\ntest_gen_U_init starting\n')
+	Us = [ sv.gen_U_init(F, Q, n, restart = i) for i in range(0, 3) ]
+	for i, U in enumerate(Us):
+		printnow('restart ' + str(i) + ' U:\n' + str(U) + '\n')
+	for U in Us:
+		assert np.allclose(U.sum(axis = 1), 1.0), 'rows of U do not sum to 1'
+	assert np.allclose(Us[1], sv.gen_U_init(F, Q, n, restart = 1)), 'restart 1 is not repeatable'
+	for i in range(0, 3):
+		for j in range(i + 1, 3):
+			assert not np.allclose(Us[i], Us[j]), 'restarts ' + str(i) + ' and ' + str(j) + ' got the same U'
+	printnow('test_gen_U_init complete\n')
+
 def test_get_C(F, Q, G, A, H, n, c_max, lamb1, lamb2):
 	m = len(F)
 	l, _ = Q.shape
 	F[0, l+1] = 0.0 # test what happens if a segment has zero copy number
 	U = gen_U(m, n)
 	printnow('\ntest_get_C starting\n') # time limit of 10 seconds
-	obj_val, C, E, R, W, err_msg = sv.get_C(F, U, Q, G, A, H, n, c_max, lamb1, lamb2, 10)
+	obj_val, C, E, A_, R, W, W_sv, W_snv, err_msg = sv.get_C(F, U, Q, G, A, H, n, c_max, lamb1, lamb2, 10)
 
 	_print_results(err_msg, U, C, E, R, W, obj_val)
 
 	printnow('test_get_C complete\n')
 
+# model size and solve time of the full and depth ancestry encodings for n from 3 to 10
+def benchmark_ancestry(F, Q, G, A, H, c_max, lamb1, lamb2, timelimit = 60):
+	m = len(F)
+	printnow('\nbenchmark_ancestry starting\n')
+	printnow('n\tancestry\trows\tseconds\tobj_val\n')
+	for n in range(3, 11):
+		U = gen_U(m, n)
+		for ancestry in ['full', 'depth']:
+			start = time.time()
+			solver = sv.CSolver(F, Q, G, n, c_max, lamb1, lamb2, ancestry = ancestry)
+			obj_val = solver.solve(U, timelimit)[0]
+			solver.mod.update()
+			printnow('%d\t%s\t%d\t%.2f\t%.4f\n' % (n, ancestry, solver.mod.NumConstrs, time.time() - start, obj_val))
+	printnow('benchmark_ancestry complete\n')
+
+# branch and bound nodes and time to optimality with and without symmetry breaking. internal nodes get zero
+#   frequency as with only_leaf, so they are interchangeable in the C step
+def benchmark_symmetry(F, Q, G, c_max, lamb1, lamb2, timelimit = 300):
+	m = len(F)
+	printnow('\nbenchmark_symmetry starting\n')
+	printnow('n\tancestry\tsymmetry\tnodes\tseconds\tobj_val\n')
+	for n in range(3, 7):
+		U = gen_U(m, n)
+		U[:, n:-1] = 0
+		U = U / U.sum(axis = 1)[:, None]
+		for ancestry in ['full', 'depth']:
+			for symmetry in [False, True]:
+				solver = sv.CSolver(F, Q, G, n, c_max, lamb1, lamb2, ancestry = ancestry, symmetry = symmetry)
+				obj_val = solver.solve(U, timelimit)[0]
+				printnow('%d\t%s\t%s\t%d\t%.2f\t%.4f\n' % (n, ancestry, symmetry, solver.mod.NodeCount, solver.mod.Runtime, obj_val))
+	printnow('benchmark_symmetry complete\n')
+
+# model size and solve time of each zero encoding on patients of simulation_data experiments, e.g.
+#   python test_solver.py benchmark_zero ../simulation_data/experiment_3_5_100_20_n
+def benchmark_zero_encoding(exp_dirs, c_max, lamb1, lamb2, timelimit = 60):
+	printnow('\nbenchmark_zero_encoding starting\n')
+	printnow('patient\tencoding\tvars\tbinaries\trows\tgen_rows\tseconds\tobj_val\n')
+	for exp_dir in exp_dirs:
+		n = _read_num_leaves(os.path.join(exp_dir, 'README.md'))
+		for patient in sorted(os.listdir(exp_dir)):
+			sample_dir = os.path.join(exp_dir, patient, 'sample') + '/'
+			if not os.path.isdir(sample_dir):
+				continue
+			mats = gm.get_mats(sample_dir, n)
+			F, Q, G = mats[0], mats[2], mats[4]
+			U = gen_U(len(F), n)
+			for zero_enc in ['bits', 'bigm', 'indicator']:
+				start = time.time()
+				solver = sv.CSolver(F, Q, G, n, c_max, lamb1, lamb2, zero_enc = zero_enc)
+				obj_val = solver.solve(U, timelimit)[0]
+				mod = solver.mod
+				printnow('%s\t%s\t%d\t%d\t%d\t%d\t%.2f\t%.4f\n' % (patient, zero_enc, mod.NumVars, mod.NumBinVars, mod.NumConstrs, mod.NumGenConstrs, time.time() - start, obj_val))
+	printnow('benchmark_zero_encoding complete\n')
+
+def _read_num_leaves(readme_fname):
+	for line in open(readme_fname):
+		if line.startswith('num_leaves:'):
+			return int(line.split(':')[1])
+
+# the tree dp on the tree of get_C should never be worse than get_C itself
+def test_get_C_tree(F, Q, G, n, c_max, lamb1, lamb2):
+	m = len(F)
+	U = gen_U(m, n)
+	printnow('\ntest_get_C_tree starting\n')
+	obj_val, C, E = sv.get_C(F, U, Q, G, None, None, n, c_max, lamb1, lamb2, 10)[:3]
+	obj_val_dp, C_dp, E_dp, A_dp, R_dp, W_dp = td.get_C_tree(F, U, E, Q, G, n, c_max, lamb1, lamb2, C_init = C)[:6]
+	_print_results(None, U, C_dp, E_dp, R_dp, W_dp, obj_val_dp)
+	printnow('get_C objective value is ' + str(obj_val) + '\n')
+	assert obj_val_dp <= obj_val + 1e-6 * max(1.0, abs(obj_val)), 'tree dp is worse than get_C on its own tree'
+	printnow('test_get_C_tree complete\n')
+
+# starts harvested from one pooled solve are distinct and continue through coordinate descent
+def test_get_pool_starts(F, Q, G, n, c_max, lamb1, lamb2, num_starts = 3):
+	printnow('\ntest_get_pool_starts starting\n')
+	starts = sv.get_pool_starts(F, Q, G, n, c_max, lamb1, lamb2, num_starts, 10)
+	printnow('number of starts:\t' + str(len(starts)) + '\n')
+	assert 0 < len(starts) <= num_starts
+	for i in range(0, len(starts)):
+		for j in range(i + 1, len(starts)):
+			C_i, E_i, C_j, E_j = starts[i][0], starts[i][1], starts[j][0], starts[j][1]
+			assert not (np.array_equal(C_i, C_j) and np.array_equal(E_i, E_j)), 'starts ' + str(i) + ' and ' + str(j) + ' are the same'
+	for i, init in enumerate(starts):
+		obj_val = sv.get_UCE(F, Q, G, None, None, n, c_max, lamb1, lamb2, 2, 10, restart = i, init = init)[8]
+		printnow('start ' + str(i) + ' objective value is ' + str(obj_val) + '\n')
+	printnow('test_get_pool_starts complete\n')
+
+# F is an exact mixture of a feasible C with sample p made only of leaf p, so with small lambdas every leaf of the
+#   optimum copies F and lies inside the bounds of get_C_bounds. the tight and loose models must then agree. with
+#   n = 3 the tree has an internal node below the root
+def test_tight_bounds(c_max, n = 2, m = 2, l = 2, r = 3, timelimit = 10):
+	printnow('\ntest_tight_bounds starting\n')
+	N = 2*n-1
+	Q = np.zeros((l, r), dtype = int)
+	Q[0, 0], Q[1, 1] = 1, 1
+	G = np.ones((l, l))  # breakpoints 0 and 1 are mates
+	U = np.zeros((m, N))
+	U[range(m), range(m)] = 1.0
+	lamb1, lamb2 = 0.1, 0.1
+	F = 3 * np.random.rand(m, l + 2*r)
+	C = sv.CSolver(F, Q, G, n, c_max, lamb1, lamb2).solve(U, timelimit)[1]
+	F = U.dot(C)
+	obj_val = sv.CSolver(F, Q, G, n, c_max, lamb1, lamb2).solve(U, timelimit)[0]
+	obj_val_tight = sv.CSolver(F, Q, G, n, c_max, lamb1, lamb2, tight_bounds = True).solve(U, timelimit)[0]
+	printnow('objective value is ' + str(obj_val) + ', with tight bounds ' + str(obj_val_tight) + '\n')
+	assert abs(obj_val - obj_val_tight) <= 1e-6 * max(1.0, abs(obj_val)), 'tight bounds changed the optimum'
+	printnow('test_tight_bounds complete\n')
+
+# a 4% subclone with copy number 2 on one segment allele mixes to 1.04. it stays free by default and is only
+#   fixed at copy number 1 when fix_tol asks for it
+def test_fix_tol(c_max, n = 3, l = 2, r = 3):
+	printnow('\ntest_fix_tol starting\n')
+	Q = np.zeros((l, r), dtype = int)
+	Q[0, 0], Q[1, 1] = 1, 1
+	F = 1.5 + np.random.rand(2, l + 2*r)
+	F[:, l + 2] = [1.04, 1.0]  # major allele of segment 2
+	C_lb, C_ub, fixed = sv.get_C_bounds(F, Q, n, c_max)
+	assert not fixed.any() and C_ub[0, l + 2] >= 2, 'columns fixed without fix_tol'
+	C_lb, C_ub, fixed = sv.get_C_bounds(F, Q, n, c_max, fix_tol = 0.05)
+	assert fixed[l + 2] and fixed.sum() == 1 and C_ub[0, l + 2] == 1
+	printnow('test_fix_tol complete\n')
+
+# segments without breakpoints are repeated, so with tol 0 the weighted compressed solve has the optimum of the
+#   uncompressed one. the two solves may each stop within gurobi's relative gap of it
+def test_compress_segments(c_max, lamb1, lamb2, n = 2, m = 2, l = 2, r = 4, timelimit = 60):
+	printnow('\ntest_compress_segments starting\n')
+	Q = np.zeros((l, r), dtype = int)
+	Q[0, 0], Q[1, 1] = 1, 1
+	G = np.ones((l, l))  # breakpoints 0 and 1 are mates
+	F = gen_F(Q, m, l, r, 5)
+	reps = [ 1 if Q[:, s].sum() > 0 else 3 for s in range(0, r) ]
+	seg = np.repeat(np.arange(0, r), reps)  # original segment of each repeated segment
+	F_rep = np.concatenate([F[:, :l], F[:, l + seg], F[:, l + r + seg]], axis = 1)
+	Q_rep = Q[:, seg]
+	F_c, Q_c, groups, weights = cp.compress_segments(F_rep, Q_rep, Q_rep.sum(axis = 0) > 0, tol = 0.0)
+	printnow('segments:\t' + str(len(seg)) + ' compressed to ' + str(len(groups)) + '\n')
+	assert len(groups) == r
+	U = gen_U(m, n)
+	obj_val, C = sv.get_C(F_rep, U, Q_rep, G, None, None, n, c_max, lamb1, lamb2, timelimit)[:2]
+	obj_val_c, C_c = sv.get_C(F_c, U, Q_c, G, None, None, n, c_max, lamb1, lamb2, timelimit, weights = weights)[:2]
+	printnow('objective value is ' + str(obj_val) + ', compressed ' + str(obj_val_c) + '\n')
+	assert cp.expand_C(C_c, groups, l).shape == C.shape
+	assert abs(obj_val - obj_val_c) <= 2 * sv.DEFAULT_MIP_GAP * max(1.0, abs(obj_val)), 'compression changed the optimum'
+	printnow('test_compress_segments complete\n')
+
+# the last 3 breakpoints are taken as SNVs and each is repeated, so each group holds 2 SNVs and has weight 2
+def test_compress_snvs(F, Q, n, g = 3):
+	printnow('\ntest_compress_snvs starting\n')
+	l_g, r = Q.shape
+	l = l_g - g
+	rows = list(range(0, l)) + list(np.repeat(np.arange(l, l_g), 2))
+	F_dup = np.concatenate([F[:, rows], F[:, l_g:]], axis = 1)
+	F_c, Q_c, snv_index, weights = cp.compress_snvs(F_dup, Q[rows], l)
+	printnow('SNVs:\t' + str(len(snv_index)) + ' collapsed to ' + str(Q_c.shape[0] - l) + '\n')
+	printnow('weights:\t' + str(weights[:Q_c.shape[0]]) + '\n')
+	assert Q_c.shape[0] - l == g and np.all(weights[l:l + g] == 2)
+	N = 2*n-1
+	C = np.tile(np.arange(0, F_c.shape[1]), (N, 1))
+	W = np.tile(np.arange(0, Q_c.shape[0]), (N, 1))
+	C_full, W_full, W_snv = cp.expand_snvs(C, W, W[:, l:], snv_index, l)
+	assert np.array_equal(snv_index, np.repeat(np.arange(0, g), 2))
+	assert np.array_equal(C_full[:, l:l + len(snv_index)], np.tile(l + snv_index, (N, 1))), 'expanded C does not match'
+	assert np.array_equal(W_full[:, l:], np.tile(l + snv_index, (N, 1))) and np.array_equal(W_snv, W_full[:, l:])
+	printnow('test_compress_snvs complete\n')
+
+# mate pairs are kept whole, every segment holding a mutation is covered when k leaves room for it and no more than
+#   k mutations are kept. breakpoints 2i and 2i+1 are mates, so any 3 pairs cover the 4 segments
+def test_sample_informative(m = 3, trials = 5):
+	printnow('\ntest_sample_informative starting\n')
+	G = np.zeros((8, 8))
+	for b in range(0, 8, 2):
+		G[b:b + 2, b:b + 2] = 1
+	bp_segs = np.array([0, 1, 1, 2, 2, 3, 3, 0])
+	snv_segs = np.array([0, 0, 1, -1, 2, 2, 3, -1, 3, 1])
+	for _ in range(0, trials):
+		for k in [3, 5, 6]:
+			picked = gm.sample_informative(8, k, np.random.rand(8, m), bp_segs, G)
+			assert len(picked) <= k
+			for b in picked:
+				assert set(np.where(G[b] == 1)[0]) <= set(picked), 'mate of breakpoint ' + str(b) + ' was dropped'
+			if k >= 6:
+				assert set(bp_segs[picked]) == set(bp_segs), 'a segment was left uncovered'
+		for k in [2, 4, 7]:
+			picked = gm.sample_informative(10, k, np.random.rand(10, m), snv_segs)
+			assert len(picked) <= k and len(set(picked)) == len(picked)
+			if k >= 4:
+				assert set(snv_segs[picked]) >= set([0, 1, 2, 3]), 'a segment was left uncovered'
+	printnow('test_sample_informative complete\n')
+
 def _print_results(err_msg, U, C, E, R, W, obj_val):
 	if err_msg != None:
 		printnow(err_msg + '\n')
@@ -0,0 +1,314 @@
+#   C step of TUSV-ext for a fixed tree. with E and U fixed the copy numbers of every segment allele are found
+#   with a Sankoff style dynamic program over 0..c_max, and the breakpoint and SNV columns by enumerating where
+#   each one appears under the gain/loss rules of solver.get_C. no gurobi model is built
+
+
+# # # # # # # # # # #
+#   I M P O R T S   #
+# # # # # # # # # # #
+
+import itertools
+import numpy as np
+from concurrent.futures import ThreadPoolExecutor
+
+# # # # # # # # # # # # #
+#   C O N S T A N T S   #
+# # # # # # # # # # # # #
+
+MAX_DP_PASSES = 20
+BP_CHUNK = 64  # breakpoints whose appearance options are enumerated at once
+
+
+# # # # # # # # # # # # #
+#   F U N C T I O N S   #
+# # # # # # # # # # # # #
+
+#  input: F (np.array of float) [m, l+g+2r] mixed copy number f_p,s of mutation s in sample p
+#         U (np.array of float) [m, 2n-1] 0 <= u_p,k <= 1. percent of sample p made by clone k
+#         E (np.array of int) [2n-1, 2n-1] e_i,j == 1 iff edge (i,j) is in tree. fixed binary tree rooted at 2n-2
+#         Q (np.array of 0 or 1) [l+g, r] q_b,s == 1 if breakpoint b is in segment s. 0 otherwise
+#         G (np.array of 0 or 1) [l, l] g_s,t == 1 if breakpoints s and t are mates. 0 otherwise
+#         n (int) number of leaves in phylogeny. 2n-1 is total number of nodes
+#         c_max (int) maximum allowed copy number for any element in output C
+#         lamb1 (float) regularization term to weight total tree cost against unmixing error
+#         lamb2 (float) regularization term to weight breakpoint frequency error
+#         C_init (None or np.array of int) [2n-1, l+g+2r] feasible C for this tree (e.g. from get_C). every group
+#           of segments linked by breakpoints keeps C_init unless the dp finds a cheaper assignment. None starts
+#           from the root copy numbers
+#         threads (int or None) number of chunks of segment columns solved concurrently
+# output: same as solver.get_C
+#  notes: the dp is exact for the tree cost. the unmixing error couples the nodes of a column through U, so each
+#         pass charges every node its error with the other nodes held at their current values and a pass is only
+#         kept for the columns it improves. breakpoint columns are exact given the segment columns
+def get_C_tree(F_phasing, U, E, Q, G, n, c_max, lamb1, lamb2, C_init=None, threads=None):
+    l_g, r = Q.shape
+    l, _ = G.shape
+    N = 2 * n - 1
+    E = np.rint(E).astype(int)
+    parent, order = get_tree_order(E)
+    Pi = get_expected_bpf(F_phasing, Q)
+    F_seg = F_phasing[:, l_g:l_g + 2*r]  # [m, 2r] major then minor allele of each segment
+
+    if C_init is None:
+        seg_fallback = np.ones((N, 2*r), dtype=int)  # root copy numbers everywhere is always feasible
+    else:
+        seg_fallback = np.rint(C_init[:, l_g:l_g + 2*r]).astype(int)
+    seg_dp = _solve_segments(F_seg, U, parent, order, c_max, lamb1, seg_fallback, threads)
+
+    seg_choices = [seg_fallback, seg_dp]
+    seg_costs = [_segment_costs(F_seg, U, parent, segs, lamb1) for segs in seg_choices]
+    bp_choices = [_solve_breakpoints(F_phasing, Pi, U, Q, G, parent, order, segs, c_max, lamb2) for segs in seg_choices]
+
+    # segments linked by a breakpoint pair share the edge the pair appears on, so they are decided together
+    C = np.zeros((N, l_g + 2*r), dtype=int)
+    app = np.full(l_g, -1)
+    bp_seg = Q.argmax(axis=1)  # segment containing each breakpoint
+    comp = _get_segment_components(Q, G)
+    for c in np.unique(comp):
+        segs = np.where(comp == c)[0]
+        cols = np.concatenate([segs, segs + r])
+        bps = np.where(np.isin(bp_seg, segs))[0]
+        costs = [seg_costs[k][cols].sum() + bp_choices[k][2][bps].sum() for k in range(0, 2)]  # inf if infeasible
+        k = 1 if costs[1] < costs[0] else 0
+        C[:, l_g + cols] = seg_choices[k][:, cols]
+        C[:, bps] = bp_choices[k][0][:, bps]
+        app[bps] = bp_choices[k][1][bps]
+    if C_init is not None:  # keep C_init for any column the enumeration could not place
+        lost = np.where(app < 0)[0]
+        C[:, lost] = np.rint(C_init[:, lost]).astype(int)
+        app[lost] = _get_appearance(C[:, lost], parent)
+
+    A = get_ancestry(E)
+    R = get_R(C[:, l_g:], E)
+    W_node = np.zeros((N, l_g), dtype=int)
+    placed = np.where(app >= 0)[0]
+    W_node[app[placed], placed] = 1
+    obj_val = calculate_objective(F_phasing, Pi, U, C, R, Q, lamb1, lamb2)
+    return obj_val, C, E, A, R, W_node, W_node[:, :l], W_node[:, l:], None
+
+
+# returns the objective of get_C for a solved C with edge costs R
+def calculate_objective(F_phasing, Pi, U, C, R, Q, lamb1, lamb2):
+    l_g, r = Q.shape
+    m, L = F_phasing.shape
+    Gam = (C[:, l_g:l_g + r] + C[:, l_g + r:l_g + 2*r]).dot(Q.T)  # [N, l+g] copy num of segment containing bp
+    S = np.abs(Pi * U.dot(Gam) - U.dot(C[:, :l_g]))
+    return np.abs(F_phasing - U.dot(C[:, :L])).sum() + lamb1 * R.sum() + lamb2 * S.sum()
+
+
+# # # # # # # # # # # # # # # # # # # # #
+#   S E G M E N T   C O L U M N S   #
+# # # # # # # # # # # # # # # # # # # # #
+
+def _solve_segments(F_seg, U, parent, order, c_max, lamb1, C0, threads):
+    k = F_seg.shape[1]
+    if threads == None or threads <= 1 or k <= 1:
+        return _dp_columns(F_seg, U, parent, order, c_max, lamb1, C0)
+    chunks = np.array_split(np.arange(0, k), min(threads, k))
+    with ThreadPoolExecutor(max_workers=threads) as pool:
+        solved = list(pool.map(lambda cols: _dp_columns(F_seg[:, cols], U, parent, order, c_max, lamb1, C0[:, cols]), chunks))
+    return np.concatenate(solved, axis=1)
+
+
+#  input: F_cols (np.array of float) [m, k] mixed copy number of k segment allele columns
+#         C0 (np.array of int) [N, k] starting copy numbers. root row is 1
+# output: C (np.array of int) [N, k] copy numbers no worse than C0 in unmixing error plus tree cost
+def _dp_columns(F_cols, U, parent, order, c_max, lamb1, C0):
+    m, k = F_cols.shape
+    N = len(parent)
+    root = order[0]
+    V = np.arange(0, c_max + 1)
+    jump = lamb1 * np.abs(V[:, None] - V[None, :])  # [V, V] tree cost of parent value to child value
+    C = C0.copy()
+    best = _segment_costs(F_cols, U, parent, C, lamb1)
+    for _ in range(0, MAX_DP_PASSES):
+        f_hat = U.dot(C)  # [m, k]
+        rest = F_cols[None, :, :] - f_hat[None, :, :] + U.T[:, :, None] * C[:, None, :]  # [N, m, k] residual without node j
+        own = np.abs(rest[:, :, :, None] - U.T[:, :, None, None] * V).sum(axis=1)  # [N, k, V] error if node j takes v
+        own[root, :, :] = np.inf
+        own[root, :, 1] = 0  # seg has copy number 1 per allele at root
+
+        tot = own
+        arg = np.zeros((N, k, V.size), dtype=int)  # arg[j, s, v] best value of node j given its parent takes v
+        for j in order[::-1]:  # children before parents
+            if parent[j] < 0:
+                continue
+            trans = tot[j][:, None, :] + jump[None, :, :]  # [k, parent value, child value]
+            arg[j] = trans.argmin(axis=2)
+            tot[parent[j]] += trans.min(axis=2)
+        new = np.zeros_like(C)
+        new[root] = tot[root].argmin(axis=1)
+        for j in order[1:]:  # parents before children
+            new[j] = arg[j][np.arange(0, k), new[parent[j]]]
+
+        cost = _segment_costs(F_cols, U, parent, new, lamb1)
+        improved = cost < best - 1e-9
+        if not improved.any():
+            break
+        C[:, improved] = new[:, improved]
+        best[improved] = cost[improved]
+    return C
+
+
+# returns [k] unmixing error plus tree cost of each column of C
+def _segment_costs(F_cols, U, parent, C, lamb1):
+    chd = np.where(parent >= 0)[0]
+    mix = np.abs(F_cols - U.dot(C)).sum(axis=0)
+    return mix + lamb1 * np.abs(C[chd] - C[parent[chd]]).sum(axis=0)
+
+
+# # # # # # # # # # # # # # # # # # # # # # # #
+#   B R E A K P O I N T   C O L U M N S   #
+# # # # # # # # # # # # # # # # # # # # # # # #
+
+#  input: segs (np.array of int) [N, 2r] segment allele copy numbers
+# output: C_bp (np.array of int) [N, l+g] best copy numbers of each breakpoint/SNV given segs
+#         app (np.array of int) [l+g] node each one appears at. -1 if it cannot be placed
+#         cost (np.array of float) [l+g] unmixing error plus bpf penalty. inf if it cannot be placed
+#  notes: a breakpoint is 0 at the root, appears once on the edge into node a with some copy number v >= 1 on one
+#         allele, and elsewhere changes exactly as that allele's segment copy number does (Gam rows of get_C).
+#         every (a, allele, v) is enumerated and mates are placed on the same edge
+def _solve_breakpoints(F_phasing, Pi, U, Q, G, parent, order, segs, c_max, lamb2):
+    l_g, r = Q.shape
+    l, _ = G.shape
+    N = len(parent)
+    Gam = np.stack([segs[:, :r].dot(Q.T), segs[:, r:].dot(Q.T)])  # [2, N, l+g]. allele 0 is D == 1 in get_C
+    sg_cpnum_est = U.dot(Gam[0] + Gam[1])  # [m, l+g]
+
+    cost_a = np.full((l_g, N), np.inf)  # best cost of each breakpoint appearing at each node
+    C_a = np.zeros((l_g, N, N), dtype=int)  # [b, a, :] column achieving cost_a[b, a]
+    for bgn in range(0, l_g, BP_CHUNK):
+        bs = np.arange(bgn, min(bgn + BP_CHUNK, l_g))
+        cost, X = _enumerate_appearances(F_phasing[:, bs], Pi[:, bs], sg_cpnum_est[:, bs], U, Gam[:, :, bs], parent, order, c_max, lamb2)
+        flat = cost.reshape(len(bs), N, -1)  # [b, a, allele and v]
+        best = flat.argmin(axis=2)
+        cost_a[bs] = np.take_along_axis(flat, best[:, :, None], axis=2)[:, :, 0]
+        C_a[bs] = np.take_along_axis(X.reshape(len(bs), N, -1, N), best[:, :, None, None], axis=2)[:, :, 0, :]
+
+    app = cost_a.argmin(axis=1)
+    for s, t in np.argwhere(np.triu(G, 1)):  # mates appear on the same edge
+        app[s] = app[t] = (cost_a[s] + cost_a[t]).argmin()
+    cost = cost_a[np.arange(0, l_g), app]
+    C_bp = C_a[np.arange(0, l_g), app].T
+    app[~ np.isfinite(cost)] = -1
+    C_bp[:, ~ np.isfinite(cost)] = 0
+    return C_bp, app, cost
+
+
+# returns cost [b, a, allele, v] and columns X [b, a, allele, v, N] of every appearance option. inf if infeasible
+def _enumerate_appearances(F_b, Pi_b, sg_b, U, Gam_b, parent, order, c_max, lamb2):
+    _, N, k = Gam_b.shape
+    root = order[0]
+    gam = Gam_b.transpose(2, 0, 1)[:, None, :, None, :]  # [b, 1, allele, 1, N]
+    a = np.arange(0, N)[None, :, None, None]  # [1, a, 1, 1]
+    v = np.arange(0, c_max + 1)[None, None, None, :]  # [1, 1, 1, v]
+    X = np.zeros((k, N, 2, c_max + 1, N), dtype=int)
+    ok = np.ones((k, N, 2, c_max + 1), dtype=bool)
+    for j in order[1:]:  # parents before children
+        p = parent[j]
+        X[..., j] = np.where(a == j, v, X[..., p] + gam[..., j] - gam[..., p])
+        ok &= (a == j) | ~ ((X[..., p] == 0) & (X[..., j] > 0))  # only one edge where it goes from 0 to non zero
+    ok &= (X >= 0).all(axis=4) & (X <= np.minimum(gam, c_max)).all(axis=4)  # cant exceed cp num of its allele
+    ok &= (v >= 1) & (a != root)
+    for j in order[1:]:  # 0 at the parent of the node it appears at, whose allele has copy number at least 1
+        ok[:, j] &= (X[:, j, :, :, parent[j]] == 0) & (gam[:, 0, :, :, j] >= 1)
+
+    f_hat = X.dot(U.T)  # [b, a, allele, v, m]
+    F_ = F_b.T[:, None, None, None, :]
+    bpf = Pi_b.T[:, None, None, None, :] * sg_b.T[:, None, None, None, :]
+    cost = np.abs(F_ - f_hat).sum(axis=4) + lamb2 * np.abs(bpf - f_hat).sum(axis=4)
+    cost[~ ok] = np.inf
+    return cost, X
+
+
+# node each breakpoint column appears at, i.e. the child of the edge where it goes from 0 to non zero. -1 if none
+def _get_appearance(C_bp, parent):
+    N, k = C_bp.shape
+    app = np.full(k, -1)
+    for j in range(0, N):
+        if parent[j] >= 0:
+            appears = (C_bp[parent[j]] == 0) & (C_bp[j] > 0) & (app < 0)
+            app[appears] = j
+    return app
+
+
+# labels [r] of the groups of segments linked by mated breakpoints
+def _get_segment_components(Q, G):
+    l, _ = G.shape
+    r = Q.shape[1]
+    bp_seg = Q.argmax(axis=1)
+    comp = np.arange(0, r)
+    for s, t in np.argwhere(np.triu(G, 1)):
+        old, new = comp[bp_seg[t]], comp[bp_seg[s]]
+        comp[comp == old] = new
+    return comp
+
+
+# # # # # # # # # # # # # # # # # # # #
+#   H E L P E R   F U N C T I O N S   #
+# # # # # # # # # # # # # # # # # # # #
+
+# returns parent [N] of each node (-1 for root) and nodes in breadth first order from the root
+def get_tree_order(E):
+    N, _ = E.shape
+    parent = np.full(N, -1)
+    for i, j in np.argwhere(E == 1):
+        parent[j] = i
+    root = np.where(parent < 0)[0][-1]
+    order = [root]
+    for i in order:
+        order += list(np.where(E[i] == 1)[0])
+    return parent, np.array(order)
+
+
+# returns every rooted binary tree E [N, N] with leaves 0..n-1, internal nodes n..N-2 and root N-1. internal nodes
+#   are distinguishable through U so every labeling counts: (2n-3)!! leaf labeled shapes times (n-2)! labelings
+def get_topologies(n):
+    N = 2 * n - 1
+    trees = [([(n, 0), (n, 1)], n)]  # (edges, root). internal nodes are numbered from n in order of creation
+    for k in range(2, n):  # leaf k goes on any edge or above the root
+        grown = []
+        new = n + k - 1
+        for edges, root in trees:
+            for e, (u, w) in enumerate(edges):
+                grown.append((edges[:e] + edges[e + 1:] + [(u, new), (new, w), (new, k)], root))
+            grown.append((edges + [(new, root), (new, k)], new))
+        trees = grown
+
+    topologies = []
+    for edges, root in trees:
+        internals = [ v for v in range(n, N) if v != root ]
+        for perm in itertools.permutations(range(n, N - 1)):
+            label = dict(zip(internals, perm))
+            label[root] = N - 1
+            E = np.zeros((N, N), dtype=int)
+            for u, w in edges:
+                E[label.get(u, u), label.get(w, w)] = 1
+            topologies.append(E)
+    return topologies
+
+
+# returns ancestry matrix A [N, N] of the tree E. a_i,j == 1 iff v_i is an ancestor of v_j
+def get_ancestry(E):
+    N, _ = E.shape
+    E = np.rint(E)
+    A = E.copy()
+    for _ in range(0, N):  # transitive closure of E
+        A = np.minimum(A + A.dot(E), 1)
+    return A
+
+
+# returns R [N, N] cost of each edge of E. C_seg [N, 2r] holds segment allele copy numbers
+def get_R(C_seg, E):
+    diff = np.abs(C_seg[:, None, :] - C_seg[None, :, :]).sum(axis=2)  # [N, N]
+    return diff * np.rint(E)
+
+
+# [m, l+g] expected bpf (ratio of bp copy num to segment copy num)
+def get_expected_bpf(F_phasing, Q):
+    l_g, r = Q.shape
+    F_seg = (F_phasing[:, l_g:l_g + r] + F_phasing[:, l_g + r:l_g + 2*r]).dot(Q.T)  # mixed copy number of segment containing breakpoint
+    with np.errstate(divide='ignore', invalid='ignore'):
+        Pi = np.true_divide(F_phasing[:, :l_g], F_seg)
+        Pi[~ np.isfinite(Pi)] = 0  # -inf inf NaN
+    return Pi
@@ -0,0 +1,148 @@
+#   fast mode of TUSV-ext. searches rooted binary trees on 2n-1 nodes with nearest neighbor interchange and
+#   subtree prune and regraft moves under simulated annealing. each tree is scored by alternating the U step
+#   (solver.get_U_highs) with the fixed tree C step (tree_dp.get_C_tree), so no MIP is solved
+
+
+# # # # # # # # # # #
+#   I M P O R T S   #
+# # # # # # # # # # #
+
+import math
+import random
+import time
+import numpy as np
+
+import solver as sv
+import tree_dp as td
+
+# # # # # # # # # # # # #
+#   C O N S T A N T S   #
+# # # # # # # # # # # # #
+
+NUM_MOVES = 200
+SCORE_ITERS = 3      # U then C alternations used to score one tree
+START_TEMP = 0.05    # starting temperature as a fraction of the starting objective
+COOLING = 0.98
+
+
+# # # # # # # # # # # # #
+#   F U N C T I O N S   #
+# # # # # # # # # # # # #
+
+#  input: same as solver.get_UCE
+#         time_limit (int or None) seconds spent scoring one tree. its U/C alternations stop once they are spent,
+#           after at least one C step. None only bounds them by max_iters and SCORE_ITERS
+#         num_moves (int) number of proposed tree moves
+#         budget (None or solver.Budget) wall clock budget. each tree is scored within a share of what is left for
+#           the remaining moves, at most time_limit, and no more moves are proposed once it expires
+# output: same as solver.get_UCE. obj_val is the objective of get_C for the returned U, C, E. metrics only has
+#         'iterations', the number of proposed moves
+def get_UCE_fast(F_phasing, Q, G, A, H, n, c_max, lamb1, lamb2, max_iters, time_limit=None, only_leaf=False, threads=None, num_moves=NUM_MOVES, budget=None):
+    np.random.seed()  # sets seed for running on multiple processors
+    random.seed()
+    m = len(F_phasing)
+    l_g, r = Q.shape
+    l, _ = G.shape
+
+    if budget is not None:
+        budget = budget.start_run()
+    _, E, _, _, _ = sv.gen_start(n, l, l_g - l, r)
+    U = sv.gen_U(m, n)
+    score_time = budget.get_time_limit(time_limit, num_moves + 1) if budget is not None else time_limit
+    cur = _score_tree(F_phasing, Q, G, E, U, n, c_max, lamb1, lamb2, only_leaf, threads, max_iters, score_time)
+    best = cur
+    temp = START_TEMP * cur[0]
+    moves = 0
+    for k in range(0, num_moves):
+        if (budget is not None and budget.expired()) or sv.preempted():
+            break
+        moves += 1
+        E_new = propose_move(cur[3])
+        if E_new is None:
+            continue
+        score_time = budget.get_time_limit(time_limit, num_moves - k) if budget is not None else time_limit
+        new = _score_tree(F_phasing, Q, G, E_new, cur[1], n, c_max, lamb1, lamb2, only_leaf, threads, max_iters, score_time)
+        if new[0] < cur[0] or (temp > 0 and random.random() < math.exp(-(new[0] - cur[0]) / temp)):
+            cur = new
+            if cur[0] < best[0]:
+                best = cur
+        temp *= COOLING
+
+    obj_val, U, C, E, A, R, W, W_sv, W_snv = best
+    return U, C, E, A, R, W, W_sv, W_snv, obj_val, None, {'iterations': moves}
+
+
+# alternates the U step and the fixed tree C step on E starting from U, for at most time_limit seconds after the
+#   first C step. returns (obj_val, U, C, E, A, R, W, W_sv, W_snv)
+def _score_tree(F_phasing, Q, G, E, U, n, c_max, lamb1, lamb2, only_leaf, threads, max_iters, time_limit=None):
+    l, _ = G.shape
+    deadline = time.time() + time_limit if time_limit != None else None
+    C = None
+    best = None
+    for i in range(0, min(SCORE_ITERS, max_iters)):
+        if i > 0 and deadline != None and time.time() >= deadline:
+            break
+        if i > 0:
+            U, err_msg = sv.get_U_highs(F_phasing, C, n, None, None, l, only_leaf, threads)
+            if err_msg != None:
+                print(err_msg)
+                break
+        obj_val, C, E, A, R, W, W_sv, W_snv, _ = td.get_C_tree(F_phasing, U, E, Q, G, n, c_max, lamb1, lamb2, C_init=C, threads=threads)
+        if best is not None and obj_val >= best[0]:
+            break
+        best = (obj_val, U, C, E, A, R, W, W_sv, W_snv)
+    return best
+
+
+# # # # # # # # # # # # # # # #
+#   T R E E   M O V E S   #
+# # # # # # # # # # # # # # # #
+
+# returns a random neighbor of E by nearest neighbor interchange or subtree prune and regraft. None if no move applies
+def propose_move(E):
+    if random.random() < 0.5:
+        return nni_move(E)
+    return spr_move(E)
+
+
+# swaps a child of internal node v with the sibling of v
+def nni_move(E):
+    E = np.rint(E).astype(int)
+    parent, _ = td.get_tree_order(E)
+    candidates = [ v for v in range(0, len(E)) if parent[v] >= 0 and E[v].sum() == 2 ]  # non root internal nodes
+    if not candidates:
+        return None
+    v = random.choice(candidates)
+    p = parent[v]
+    s = [ x for x in np.where(E[p] == 1)[0] if x != v ][0]
+    c = random.choice(list(np.where(E[v] == 1)[0]))
+    E[p, s], E[v, c] = 0, 0
+    E[p, c], E[v, s] = 1, 1
+    return E
+
+
+# prunes the subtree below x with its parent p and regrafts it onto an edge outside the subtree. p keeps its label
+#   so internal nodes stay internal and the root stays v_{N-1}
+def spr_move(E):
+    E = np.rint(E).astype(int)
+    N = len(E)
+    parent, _ = td.get_tree_order(E)
+    A = td.get_ancestry(E)
+    candidates = [ x for x in range(0, N) if parent[x] >= 0 and parent[parent[x]] >= 0 ]  # p is not the root
+    if not candidates:
+        return None
+    x = random.choice(candidates)
+    p = parent[x]
+    gp = parent[p]
+    s = [ y for y in np.where(E[p] == 1)[0] if y != x ][0]
+    # any edge (u, w) outside the subtree of x. (gp, s) after the prune would give back E
+    targets = [ w for w in range(0, N) if parent[w] >= 0 and w not in (x, p, s) and A[x, w] == 0 ]
+    if not targets:
+        return None
+    w = random.choice(targets)
+    u = parent[w]
+    E[gp, p], E[p, s] = 0, 0
+    E[gp, s] = 1  # prune
+    E[u, w] = 0
+    E[u, p], E[p, w] = 1, 1  # regraft p (still parent of x) onto edge (u, w)
+    return E
@@ -9,6 +9,8 @@ import sys      # for command line arguments
 import os       # for manipulating files and folders
 import argparse # for command line arguments
 import random
+import time
+import signal
 import numpy as np
 import multiprocessing as mp
 
@@ -21,6 +23,9 @@ from io import StringIO # for converting string to file (for creating initial ph
 sys.path.insert(0, 'model/')
 sys.path.insert(0, 'help/')
 import solver as sv
+import checkpoint as ckpt
+import compress as cp
+import tree_search as ts
 import file_manager as fm      # sanitizes file and directory arguments
 import generate_matrices as gm # gets F, Q, G, A, H from .vcf files
 import printer as pt
@@ -39,6 +44,7 @@ MAX_RESTART_ITERS = 1000
 NUM_CORES = mp.cpu_count()
 METADATA_FNAME = 'data/2017_09_18_metadata.vcf'
 STR_DTYPE = 'S50'
+PREEMPT_POLL = 1  # seconds between checks for SIGTERM while waiting on pool results
 
 
 # # # # # # # # # # # # #
@@ -48,19 +54,46 @@ STR_DTYPE = 'S50'
 def main(argv):
     args = get_args(argv)
     write_readme(args['output_directory'], args)
-    unmix(args['input_directory'], args['output_directory'], args['num_leaves'], args['c_max'], args['lambda1'], args['lambda2'], args['restart_iters'], args['cord_desc_iters'], args['processors'], args['time_limit'], args['metadata_file'], args['num_subsamples'], args['overide_lambdas'], args['constant'], args['sv_upperbound'], args['only_leaf'], args['collapse'], args['threshold'], args['multi_num_clones'])
+    stop_policy = sv.StopPolicy(args['stall_time'], args['stall_min_time'], args['mip_gap'], args['target_obj'])
+    previous_handler = signal.signal(signal.SIGTERM, handle_sigterm)  # covers every phase of unmix. pool workers reset it
+    try:
+        unmix(args['input_directory'], args['output_directory'], args['num_leaves'], args['c_max'], args['lambda1'], args['lambda2'], args['restart_iters'], args['cord_desc_iters'], args['processors'], args['time_limit'], args['metadata_file'], args['num_subsamples'], args['overide_lambdas'], args['constant'], args['sv_upperbound'], args['only_leaf'], args['collapse'], args['threshold'], args['multi_num_clones'], args['u_solver'], args['ancestry'], args['zero_encoding'], args['tree_refine'], args['mode'], args['enumerate_trees'], args['u_init'], args['pool_starts'], args['early_abandon'], stop_policy, args['total_time'], args['checkpoint'], args['resume'], args['scan_mode'], args['scan_tol'], args['scan_patience'], args['tight_bounds'], args['symmetry_breaking'], args['compress_segments'], args['compress_tol'], args['dedupe_snvs'], args['sampler'], args['fix_tol'])
+    finally:
+        signal.signal(signal.SIGTERM, previous_handler)
 
 
 #  input: num_seg_subsamples (int or None) number of segments to include in deconvolution. these are
 #           in addition to any segments contining an SV as thos are manditory for the SV. None is all segments
 def unmix(in_dir, out_dir, n, c_max, lamb1, lamb2, num_restarts, num_cd_iters, num_processors, time_limit, metadata_fname, \
-          num_seg_subsamples, should_overide_lambdas, const, sv_ub, only_leaf, collapse, threshold, multi_num_clones=False):
+          num_seg_subsamples, should_overide_lambdas, const, sv_ub, only_leaf, collapse, threshold, multi_num_clones=False, u_solver='gurobi', ancestry='full', zero_enc='bits', tree_refine=False, mode='mip', enumerate_trees=False, u_init='random', pool_starts=None, early_abandon=False, stop_policy=None, total_time=None, checkpoint=False, resume=False, scan_mode='sequential', scan_tol=None, scan_patience=1, tight_bounds=False, symmetry=False, compress_segs=False, compress_tol=0.0, dedupe_snvs=False, sampler='random', fix_tol=None):
+    budget = sv.Budget(time.time() + total_time) if total_time != None else None  # shared by every solve below
     print("unmix")
-
+    ckpt_dir = get_checkpoint_dir(out_dir, checkpoint or resume, resume)
+
+    # sampling of mutations and segments is random, so a resumed run reuses the matrices of the run it resumes. the
+    #   arguments that shape those matrices and the restart iterates are saved with them and must match on resume
+    run_args = {'-n': n, '-c': c_max, '-l': lamb1, '-a': lamb2, '-b': should_overide_lambdas, '-s': num_seg_subsamples, '-C': const,
+                '-sv_ub': sv_ub, '-smp': sampler, '-cs': compress_segs, '-cs_tol': compress_tol, '-ds': dedupe_snvs}
+    inputs = None
+    if resume:
+        saved = ckpt.load(ckpt.get_path(ckpt_dir, 'inputs'))
+        if saved is not None:
+            check_resume_args(saved.get('args') if isinstance(saved, dict) else None, run_args)
+            inputs = saved['inputs']
+    if inputs is None:
+        F_phasing_full, F_unsampled_phasing_full, Q_full, Q_unsampled_full, G, G_unsampled, A, H, bp_attr, cv_attr, F_info_phasing, \
+        F_unsampled_info_phasing, sampled_snv_list_sort, unsampled_snv_list_sort, sampled_sv_list_sort, unsampled_sv_list_sort, sampleList = gm.get_mats(in_dir, n, const=const, sv_ub=sv_ub, sampler=sampler)
+
+        Q_full, Q_unsampled_full, G, A, H, F_phasing_full, F_unsampled_phasing_full = check_valid_input(Q_full, Q_unsampled_full,G, A, H, F_phasing_full, F_unsampled_phasing_full)
+        F_phasing, Q, Q_unsampled, org_indxs = randomly_remove_segments(F_phasing_full, Q_full, Q_unsampled_full, num_seg_subsamples)
+        inputs = (F_phasing_full, F_unsampled_phasing_full, Q_full, Q_unsampled_full, G, G_unsampled, A, H, bp_attr, cv_attr, F_info_phasing,
+                  F_unsampled_info_phasing, sampled_snv_list_sort, unsampled_snv_list_sort, sampled_sv_list_sort, unsampled_sv_list_sort, sampleList,
+                  F_phasing, Q, Q_unsampled, org_indxs)
+        if ckpt_dir != None:
+            ckpt.save(ckpt.get_path(ckpt_dir, 'inputs'), {'args': run_args, 'inputs': inputs})
     F_phasing_full, F_unsampled_phasing_full, Q_full, Q_unsampled_full, G, G_unsampled, A, H, bp_attr, cv_attr, F_info_phasing, \
-    F_unsampled_info_phasing, sampled_snv_list_sort, unsampled_snv_list_sort, sampled_sv_list_sort, unsampled_sv_list_sort, sampleList = gm.get_mats(in_dir, n, const=const, sv_ub=sv_ub)
-    
-    Q_full, Q_unsampled_full, G, A, H, F_phasing_full, F_unsampled_phasing_full = check_valid_input(Q_full, Q_unsampled_full,G, A, H, F_phasing_full, F_unsampled_phasing_full)
+    F_unsampled_info_phasing, sampled_snv_list_sort, unsampled_snv_list_sort, sampled_sv_list_sort, unsampled_sv_list_sort, sampleList, \
+    F_phasing, Q, Q_unsampled, org_indxs = inputs
 
     #np.savetxt(out_dir + "/F_info_phasing.csv", F_info_phasing, delimiter='\t', fmt='%s')
 
@@ -83,7 +116,6 @@ def unmix(in_dir, out_dir, n, c_max, lamb1, lamb2, num_restarts, num_cd_iters, n
     np.savetxt(out_dir + "/unsampled_snv_list_sort.csv", unsampled_snv_list_sort, delimiter='\t', fmt='%d')
     np.savetxt(out_dir + "/sampled_sv_list_sort.csv", sampled_sv_list_sort, delimiter='\t', fmt='%d')
     np.savetxt(out_dir + "/unsampled_sv_list_sort.csv", unsampled_sv_list_sort, delimiter='\t', fmt='%d')
-    F_phasing, Q, Q_unsampled, org_indxs = randomly_remove_segments(F_phasing_full, Q_full, Q_unsampled_full, num_seg_subsamples)
     np.savetxt(out_dir + '/F_phasing.tsv', F_phasing, delimiter='\t', fmt='%.8f')
     np.savetxt(out_dir + '/F_unsampled_phasing_full.tsv', F_unsampled_phasing_full, delimiter='\t', fmt='%.8f')
     # replace lambda1 and lambda2 with input derived values if should_orveride_lamdas was specified
@@ -96,12 +128,77 @@ def unmix(in_dir, out_dir, n, c_max, lamb1, lamb2, num_restarts, num_cd_iters, n
         lamb1 = float(l_g + 2*r) / float(2*r) * float(m) / float(2 * (n-1) )/2
         lamb2 = float(l_g + 2*r) / float(l_g)/2
 
-    Us, Cs, Es, As, obj_vals, Rs, Ws, W_SVs, W_SNVs = [], [], [], [], [], [], [], [], []
+    # equal SNVs and runs of equal segments are solved as one column each, and the solution is expanded back to
+    #   every column after each solve (expand_result)
+    l = G.shape[0]
+    groups, snv_index, weights = None, None, None
+    if (compress_segs or dedupe_snvs) and mode == 'fast':
+        print('Column compression is skipped in fast mode. the tree dynamic program has no column weights')
+    else:
+        if dedupe_snvs:
+            F_phasing, Q, snv_index, weights = cp.compress_snvs(F_phasing, Q, l)
+            print('Collapsed ' + str(len(snv_index)) + ' sampled SNVs to ' + str(Q.shape[0] - l))
+        if compress_segs:
+            keep = (Q[:l].sum(axis=0) > 0) | (Q_unsampled[:len(unsampled_sv_list_sort)].sum(axis=0) > 0)  # segments holding an SV
+            seg_idxs = [ i - l_g for i in org_indxs ] if org_indxs != None else range(0, r)
+            seg_chrm = [ cv_attr[s][0] for s in seg_idxs ]
+            F_phasing, Q, groups, weights = cp.compress_segments(F_phasing, Q, keep, seg_chrm, compress_tol, weights)
+            print('Compressed ' + str(r) + ' segments to ' + str(len(groups)))
+    l_g_solve = Q.shape[0]
+
+    Us, Cs, Es, As, obj_vals, Rs, Ws, W_SVs, W_SNVs, metrics = [], [], [], [], [], [], [], [], [], []
     num_complete = 0
     if not multi_num_clones:
-        for i in range(0, num_restarts):
-            U, C, E, A_, R, W, W_SV, W_SNV, obj_val, err_msg = sv.get_UCE(F_phasing, Q, G, A, H, n, c_max, lamb1, lamb2, num_cd_iters, time_limit, only_leaf)
+        threads = max(1, NUM_CORES // num_processors)  # split gurobi's threads between the workers
+        if pool_starts != None:  # -pool asks for this many restarts and may get fewer, see get_pool_starts
+            num_restarts = pool_starts
+        budgets = get_restart_budgets(budget, num_restarts, num_processors)
+        ckpt_paths = [None] * num_restarts
+        if mode == 'fast':  # tree search without a MIP. -t bounds the U/C alternations used to score each tree
+            run_restart = setup_get_UCE_fast
+            restart_args = [ (F_phasing, Q, G, A, H, n, c_max, lamb1, lamb2, num_cd_iters, time_limit, only_leaf, threads, ts.NUM_MOVES, budgets[i]) for i in range(0, num_restarts) ]
+        else:
+            run_restart = setup_get_UCE
+            starts = [None] * num_restarts
+            if pool_starts != None:  # restarts continue from spread out solutions of one pooled C step solve
+                starts = ckpt.load(ckpt.get_path(ckpt_dir, 'pool_starts')) if resume else None
+                if starts is None:
+                    pool_time = budget.get_time_limit(time_limit, len(set([ b.runs_after for b in budgets ])) + 1) if budget != None else time_limit
+                    starts = sv.get_pool_starts(F_phasing, Q, G, n, c_max, lamb1, lamb2, pool_starts, pool_time, only_leaf, NUM_CORES, ancestry, zero_enc, u_init, tight_bounds, symmetry, weights, fix_tol)
+                    if sv.preempted():
+                        sys.exit('SIGTERM received while solving the pool starts, so nothing is written')
+                    if not starts:
+                        sys.exit('The pool starts C step found no solution, so nothing is written')
+                    if ckpt_dir != None:
+                        ckpt.save(ckpt.get_path(ckpt_dir, 'pool_starts'), starts)
+                num_restarts = len(starts)
+                budgets = get_restart_budgets(budget, num_restarts, num_processors)
+            if ckpt_dir != None:
+                ckpt_paths = [ ckpt.get_path(ckpt_dir, 'restart_' + str(i)) for i in range(0, num_restarts) ]
+            shared = None
+            if early_abandon:  # restarts share their best objective and visited C through a manager process
+                manager = mp.Manager()
+                shared = sv.SharedIncumbent(manager.dict(), manager.Lock())
+            restart_args = [ (F_phasing, Q, G, A, H, n, c_max, lamb1, lamb2, num_cd_iters, time_limit, only_leaf, threads, u_solver, ancestry, zero_enc, tree_refine, enumerate_trees, u_init, i, starts[i], shared, stop_policy, budgets[i], ckpt_paths[i], tight_bounds, symmetry, weights, fix_tol) for i in range(0, num_restarts) ]
+        if num_processors > 1:
+            pool = mp.Pool(processes = min(num_processors, num_restarts), initializer = reset_sigterm)
+            results = pool.imap(run_restart, restart_args)  # yields in submission order so best_i does not depend on completion order
+        else:
+            pool = None
+            results = map(run_restart, restart_args)
+        restart_results = []
+        for i, result in enumerate(preemptible(results)):
             printnow(str(i + 1) + ' of ' + str(num_restarts) + ' random restarts complete\n')
+            restart_results.append(result)
+        if sv.preempted():
+            printnow('SIGTERM received. writing the best solution found so far\n')
+            if pool is not None:
+                pool.terminate()
+                pool = None
+            restart_results += [ load_checkpointed_result(ckpt_paths[i]) for i in range(len(restart_results), num_restarts) ]
+        for U, C, E, A_, R, W, W_SV, W_SNV, obj_val, err_msg, run_metrics in restart_results:
+            if C is not None:
+                C, W, W_SNV = expand_result(C, W, W_SNV, groups, snv_index, l, l_g_solve)
             Us.append(U)
             Cs.append(C)
             Es.append(E)
@@ -111,6 +208,15 @@ def unmix(in_dir, out_dir, n, c_max, lamb1, lamb2, num_restarts, num_cd_iters, n
             W_SVs.append(W_SV)
             W_SNVs.append(W_SNV)
             obj_vals.append(obj_val)
+            metrics.append(run_metrics)
+        if pool is not None:
+            pool.close()
+            pool.join()
+
+        if min(obj_vals) == float('inf'):  # e.g. -T was spent before the restarts began
+            write_metrics(out_dir + '/run_metrics.tsv', 'restart', list(range(0, num_restarts)), metrics)
+            reasons = sorted(set([ result[9] if result[9] != None else str(result[10].get('stop_reason')) for result in restart_results ]))
+            sys.exit('No restart found a solution, so nothing is written. stop reason: ' + '; '.join(reasons))
 
         best_i = 0
         best_obj_val = obj_vals[best_i]
@@ -121,6 +227,7 @@ def unmix(in_dir, out_dir, n, c_max, lamb1, lamb2, num_restarts, num_cd_iters, n
 
         with open(out_dir + "/training_objective", 'w') as f:
             f.write(str(best_obj_val))
+        write_metrics(out_dir + '/run_metrics.tsv', 'restart', list(range(0, num_restarts)), metrics)
         E_pre = copy.deepcopy(Es[best_i])
         R_pre = copy.deepcopy(Rs[best_i])
         W_pre = copy.deepcopy(Ws[best_i])
@@ -152,12 +259,34 @@ def unmix(in_dir, out_dir, n, c_max, lamb1, lamb2, num_restarts, num_cd_iters, n
 
     else:
         training_obj = np.zeros(n-1)
-        for n_ in range(2, n+1):
-            print("Now testing n value: ", n_)
-            U, C, E, A_, R, W, W_SV, W_SNV, obj_val, err_msg = sv.get_UCE(F_phasing, Q, G, A, H, n_, c_max, lamb1,
-                                                                              lamb2, num_cd_iters, time_limit, only_leaf)
+        n_values = list(range(2, n+1))
+
+        def get_scan_args(n_, init, n_budget, threads):
+            if mode == 'fast':
+                return (F_phasing, Q, G, A, H, n_, c_max, lamb1, lamb2, num_cd_iters, time_limit, only_leaf, threads, ts.NUM_MOVES, n_budget)
+            ckpt_path = ckpt.get_path(ckpt_dir, 'num_clone_' + str(n_)) if ckpt_dir != None else None
+            return (F_phasing, Q, G, A, H, n_, c_max, lamb1, lamb2, num_cd_iters, time_limit, only_leaf, threads, u_solver, ancestry, zero_enc,
+                    tree_refine, enumerate_trees, u_init, 0, init, None, stop_policy, n_budget, ckpt_path, tight_bounds, symmetry, weights, fix_tol)
+
+        run_scan = setup_get_UCE_fast if mode == 'fast' else setup_get_UCE
+        pool = None
+        if scan_mode == 'parallel' and num_processors > 1:  # n values are solved at once, consumed in order
+            budgets = get_restart_budgets(budget, len(n_values), num_processors)
+            threads = max(1, NUM_CORES // num_processors)
+            pool = mp.Pool(processes = min(num_processors, len(n_values)), initializer = reset_sigterm)
+            results = pool.imap(run_scan, [ get_scan_args(n_, None, budgets[i], threads) for i, n_ in enumerate(n_values) ])
+        else:
+            results = scan_clone_numbers(F_phasing, run_scan, get_scan_args, n_values, budget, scan_mode == 'warm' and mode != 'fast')
+
+        plateau = 0
+        for n_, (U, C, E, A_, R, W, W_SV, W_SNV, obj_val, err_msg, run_metrics) in zip(n_values, preemptible(results)):
+            if C is None:
+                print('Stopping the scan before n value: ', n_, '. ', err_msg)
+                break
+            C, W, W_SNV = expand_result(C, W, W_SNV, groups, snv_index, l, l_g_solve)
             printnow(str(n_) + ' of ' + str(num_restarts) + ' num of clones restarts complete\n')
             training_obj[n_-2] = obj_val
+            metrics.append(run_metrics)
             E_pre = copy.deepcopy(E)
             R_pre = copy.deepcopy(R)
             W_pre = copy.deepcopy(W)
@@ -191,7 +320,21 @@ def unmix(in_dir, out_dir, n, c_max, lamb1, lamb2, num_restarts, num_cd_iters, n
                 os.mkdir(out_dir + '/num_clone_' + str(n_))
             write_to_files(out_dir + '/num_clone_' + str(n_) + '/', l_g, U, C, E, R, W, W_SV, W_SNV, W_SNV_unsampled,W_con, obj_val, F_phasing_full,
                            F_unsampled_phasing_full, org_indxs, writer, E_pre, R_pre, W_pre, B, A_, sampleList)
+
+            # stop at the elbow: scan_patience n values in a row that improve the objective by at most scan_tol of it
+            if scan_tol != None and n_ > 2:
+                prev_obj = training_obj[n_-3]
+                plateau = plateau + 1 if prev_obj - obj_val <= scan_tol * abs(prev_obj) else 0
+                if plateau >= scan_patience:
+                    print('Training objective plateaued. stopping the scan at n value: ', n_)
+                    break
+        if sv.preempted():
+            printnow('SIGTERM received. the scan stopped after the n values written so far\n')
+        if pool is not None:
+            pool.terminate()  # n values past a plateau may still be running
+            pool.join()
         np.savetxt(out_dir + '/training_obj_list.csv', training_obj, delimiter='\t')
+        write_metrics(out_dir + '/run_metrics.tsv', 'num_clones', list(range(2, 2 + len(metrics))), metrics)
 
 def create_binary_matrix(W_con, A):
     B = copy.deepcopy(W_con)
@@ -440,6 +583,14 @@ def write_readme(dname, args, script_name = os.path.basename(__file__)):
     readme.close()
     return readme_fname
 
+# writes one line per run of get_UCE with its iterations, why coordinate descent stopped and why each C step stopped
+def write_metrics(fname, key_name, keys, metrics):
+    with open(fname, 'w') as f:
+        f.write(key_name + '\titerations\tstop_reason\tc_step_stops\n')
+        for key, run_metrics in zip(keys, metrics):
+            c_step_stops = ','.join(run_metrics.get('c_step_stops', []))
+            f.write('%s\t%d\t%s\t%s\n' % (key, run_metrics['iterations'], run_metrics.get('stop_reason', ''), c_step_stops))
+
 def _arg_val_to_str(v):
     if isinstance(v, list):
         return ' '.join([ str(x) for x in v ])
@@ -500,9 +651,98 @@ def random_subset(lst, k):
                 result[s] = item
     return result
 
+# C, W and W_SNV solved on the compressed matrices of unmix, expanded to every segment and sampled SNV. groups
+#   and snv_index are None for no compression. l_g_solve is the number of breakpoint and SNV columns solved on
+def expand_result(C, W, W_SNV, groups, snv_index, l, l_g_solve):
+    if groups != None:
+        C = cp.expand_C(C, groups, l_g_solve)
+    if snv_index is not None:
+        C, W, W_SNV = cp.expand_snvs(C, W, W_SNV, snv_index, l)
+    return C, W, W_SNV
+
+# one budget per restart. restarts run in waves of num_processors, and a restart shares what is left of the
+#   budget with the waves after its own. None if there is no budget
+def get_restart_budgets(budget, num_restarts, num_processors):
+    if budget == None:
+        return [None] * num_restarts
+    waves = (num_restarts + num_processors - 1) // num_processors
+    return [ sv.Budget(budget.deadline, waves - 1 - i // num_processors) for i in range(0, num_restarts) ]
+
+# yields the get_UCE output of each n value of the scan one after another. with warm, n value n_+1 starts from the
+#   n_ solution with its worst fitting leaf split in two (solver.split_worst_leaf)
+def scan_clone_numbers(F_phasing, run_scan, get_scan_args, n_values, budget, warm):
+    prev = None
+    for n_ in n_values:
+        if (budget != None and budget.expired()) or sv.preempted():
+            return
+        n_budget = sv.Budget(budget.deadline, n_values[-1] - n_) if budget != None else None  # equal share of what is left for each remaining n value
+        init = None
+        if warm and prev is not None and prev[1] is not None:
+            init = sv.split_worst_leaf(F_phasing, prev[0], prev[1], prev[2], prev[5], n_ - 1)
+        print("Now testing n value: ", n_)
+        result = run_scan(get_scan_args(n_, init, n_budget, None))
+        prev = copy.deepcopy(result) if warm else None  # collapse_nodes edits the yielded arrays in place
+        yield result
+
+# returns the checkpoint directory of out_dir, made if needed, or None without checkpointing. entries of an
+#   earlier run are removed unless it is being resumed
+def get_checkpoint_dir(out_dir, checkpoint, resume):
+    if not checkpoint:
+        return None
+    ckpt_dir = os.path.join(out_dir, 'checkpoint')
+    if not os.path.isdir(ckpt_dir):
+        os.makedirs(ckpt_dir)
+    elif not resume:
+        ckpt.clear(ckpt_dir)
+    return ckpt_dir
+
+# exits if the arguments of a resumed run differ from saved_args, the ones its checkpoint was written with. the
+#   checkpointed matrices and iterates would not fit the new arguments
+def check_resume_args(saved_args, run_args):
+    if saved_args is None:
+        sys.exit('The checkpoint does not record the arguments it was written with, so it cannot be resumed')
+    changed = [ k + ' ' + str(saved_args.get(k)) + ' -> ' + str(v) for k, v in sorted(run_args.items()) if saved_args.get(k) != v ]
+    if changed:
+        sys.exit('Cannot resume. these arguments differ from the checkpointed run: ' + ', '.join(changed))
+
+# SIGTERM handler of the main process. only sets the flag of solver.preempt, so a C step solved in this process
+#   stops at its next callback and unmix writes out the best solution found before it exits
+def handle_sigterm(signum, frame):
+    sv.preempt()
+
+# initializer of the pool workers, so pool.terminate still ends them
+def reset_sigterm():
+    signal.signal(signal.SIGTERM, signal.SIG_DFL)
+
+# yields the results of a pool.imap or map until they run out or SIGTERM is received. an imap is polled, so a
+#   SIGTERM is seen without waiting for the next result. a map stops after the result being computed
+def preemptible(results):
+    while not sv.preempted():
+        try:
+            result = results.next(timeout = PREEMPT_POLL) if hasattr(results, 'next') else next(results)
+        except mp.TimeoutError:
+            continue
+        except StopIteration:
+            return
+        yield result
+
+# result of a restart as get_UCE returns it, from its checkpoint. an unfinished restart gives its last iterate and a
+#   restart without a checkpoint gives objective inf
+def load_checkpointed_result(path):
+    saved = ckpt.load(path) if path != None else None
+    if saved is None:
+        return (None,) * 8 + (float('inf'), 'preempted', {'iterations': 0, 'stop_reason': 'preempted', 'c_step_stops': []})
+    if saved['done']:
+        return saved['result']
+    saved['metrics']['stop_reason'] = 'preempted'
+    return tuple(saved['iterate']) + (None, saved['metrics'])
+
 def setup_get_UCE(args):
     return sv.get_UCE(*args)
 
+def setup_get_UCE_fast(args):
+    return ts.get_UCE_fast(*args)
+
 def printnow(s):
     sys.stdout.write(s)
     sys.stdout.flush()
@@ -731,7 +971,22 @@ def get_args(argv):
     parser.add_argument('-i', '--input_directory', required = True, type = lambda x: fm.valid_dir_ext(parser, x, '.vcf'), help = 'directory containing a .vcf for each sample from a single patient')
     parser.add_argument('-o', '--output_directory', required = True, type = lambda x: fm.valid_dir(parser, x), help = 'empty directory for output U.tsv, C.tsv, and T.dot files to go')
     set_non_dir_args(parser)
-    return vars(parser.parse_args(argv))
+    args = vars(parser.parse_args(argv))
+    check_arg_combinations(parser, args)
+    return args
+
+# exits through parser.error for options that have no effect in combination with the others
+def check_arg_combinations(parser, args):
+    if args['pool_starts'] != None and args['restart_iters'] != None:
+        parser.error('-pool sets the number of restarts, so it cannot be combined with -r')
+    if args['pool_starts'] == None and args['restart_iters'] == None:
+        parser.error('one of -r/--restart_iters or -pool/--pool_starts is required')
+    if args['pool_starts'] != None and (args['mode'] == 'fast' or args['multi_num_clones']):
+        parser.error('-pool only applies to the restarts of --mode mip without -scan')
+    if args['fix_tol'] != None and not args['tight_bounds']:
+        parser.error('-ft/--fix_tol only applies with -tb/--tight_bounds')
+    if args['enumerate_trees'] and args['num_leaves'] <= sv.MAX_ENUM_LEAVES and (args['symmetry_breaking'] or args['ancestry'] != 'full'):
+        parser.error('-enum fixes the tree, so -sym and -anc depth do not apply to it')
 
 def set_non_dir_args(parser):
     parser.add_argument('-n', '--num_leaves', required = True, type = lambda x: fm.valid_int_in_range(parser, x, 2, MAX_NUM_LEAVES), help = 'number of leaves for inferred binary tree. total number of nodes will be 2*n-1')
@@ -739,18 +994,44 @@ def set_non_dir_args(parser):
     parser.add_argument('-l', '--lambda1', default = 0.25, type = lambda x: fm.valid_float_above(parser, x, 0.0), help = 'regularization term to weight total tree cost against unmixing error in objective function. setting as 0.0 will put no tree cost constraint. setting as 1.0 will equally consider tree cost and unmixing error.')
     parser.add_argument('-a', '--lambda2', default = 6.25, type = lambda x: fm.valid_float_above(parser, x, 0.0), help = 'regularization term to weight error in inferred ratio between copy number of a breakpoint and the copy number of the segment originally containing the position of breakpoint')
     parser.add_argument('-t', '--cord_desc_iters', required = True, type = lambda x: fm.valid_int_in_range(parser, x, 1, MAX_CORD_DESC_ITERS), help = 'maximum number of cordinate descent iterations for each initialization of U')
-    parser.add_argument('-r', '--restart_iters', required = True, type = lambda x: fm.valid_int_in_range(parser, x, 1, MAX_RESTART_ITERS), help = 'number of random initializations for picking usage matrix U')
-    parser.add_argument('-p', '--processors', default = 1, type = lambda x: fm.valid_int_in_range(parser, x, 1, NUM_CORES), help = 'number of processors to use')
-    parser.add_argument('-m', '--time_limit', type = int, help = 'maximum time (in seconds) allowed for a single iteration of the cordinate descent algorithm')
+    parser.add_argument('-r', '--restart_iters', type = lambda x: fm.valid_int_in_range(parser, x, 1, MAX_RESTART_ITERS), help = 'number of random initializations for picking usage matrix U. required unless -pool is given')
+    parser.add_argument('-p', '--processors', default = 1, type = lambda x: fm.valid_int_in_range(parser, x, 1, NUM_CORES), help = 'number of processors to use. random restarts are spread over a pool of this many workers')
+    parser.add_argument('-m', '--time_limit', type = int, help = 'maximum time (in seconds) allowed for a single iteration of the cordinate descent algorithm. in --mode fast, the time spent scoring one tree')
     parser.add_argument('-s', '--num_subsamples', type = int, default = None, help = 'number of segments (in addition to those containing breakpoints) that are to be randomly kept for deconvolution. default keeps all segments.')
     parser.add_argument('-d', '--metadata_file', default = METADATA_FNAME, type = lambda x: fm.is_valid_file(parser, x), help = 'file containing metadata information for output .vcf file')
     parser.add_argument('-b', '--overide_lambdas', action = 'store_true', help = 'specify this argument if you would like the parameters lambda1 and lambda2 to be set proportional to the input data set')
     parser.add_argument('-C', '--constant', default = 120, type = int, help = 'max constant for sampling SNVs')
+    parser.add_argument('-smp', '--sampler', default = 'random', choices = sorted(gm.SAMPLERS.keys()), help = 'how SVs and SNVs are picked when there are more than -sv_ub and -C. informative keeps the mutations whose mixed copy numbers vary most across samples, at least one per segment, and keeps mate pairs whole')
     parser.add_argument('-sv_ub', '--sv_upperbound', default = -1, type = int, help = 'max constant for sampling SVs')
     parser.add_argument('-leaf', '--only_leaf', action = 'store_true', help = 'if only deconvolute for leaves')
     parser.add_argument('-col', '--collapse', action='store_true', help='if collapse nodes')
     parser.add_argument('-th', '--threshold', default = 0.0, type = lambda x: fm.valid_float_above(parser, x, 0.0), help = 'mean frequency threshold to collapsing')
     parser.add_argument('-scan', '--multi_num_clones', action='store_true', help='Scan a range of number of clones to get optimal number of clones')
+    parser.add_argument('-us', '--u_solver', default = 'gurobi', choices = ['gurobi', 'highs'], help = 'solver for the U step of coordinate descent. highs solves each sample as a separate LP with scipy and needs no gurobi license')
+    parser.add_argument('-anc', '--ancestry', default = 'full', choices = ['full', 'depth'], help = 'ancestry encoding in the C step. depth replaces the O(N^3) ancestry rows with one depth label row per edge')
+    parser.add_argument('-ze', '--zero_encoding', default = 'bits', choices = ['bits', 'bigm', 'indicator'], help = 'encoding of whether a copy number is zero in the C step. bigm and indicator avoid the bit decomposition variables')
+    parser.add_argument('-tr', '--tree_refine', action = 'store_true', help = 'refine the copy numbers of each restart on its final tree with the tree dynamic program')
+    parser.add_argument('-mode', '--mode', default = 'mip', choices = ['mip', 'fast'], help = 'mip solves the C step as a gurobi MIP. fast searches tree topologies with simulated annealing and the tree dynamic program for triage runs')
+    parser.add_argument('-enum', '--enumerate_trees', action = 'store_true', help = 'for n <= 5, solve the C step once per tree topology with the tree fixed, in parallel, and keep the best. -m is shared by all topologies of a C step. the best is the global optimum for U only when every topology is solved to optimality, which run_metrics.tsv reports as optimal. cannot be combined with -sym or -anc depth')
+    parser.add_argument('-pool', '--pool_starts', type = lambda x: fm.valid_int_in_range(parser, x, 1, MAX_RESTART_ITERS), help = 'alternative to -r. take this many restarts from the solution pool of a single C step solve, as far apart as possible, and continue coordinate descent from each')
+    parser.add_argument('-ea', '--early_abandon', action = 'store_true', help = 'stop a restart once the lower bound of its C step is above the best finished restart, or once it reaches the same C as another restart')
+    parser.add_argument('-stall', '--stall_time', type = float, default = None, help = 'stop a C step solve after this many seconds without a better solution or a change in its gap. off by default')
+    parser.add_argument('-stall_min', '--stall_min_time', type = float, default = 0.0, help = 'seconds a C step solve runs before --stall_time applies')
+    parser.add_argument('-gap', '--mip_gap', type = float, default = None, help = 'stop a C step solve once its relative optimality gap is at most this. default is gurobi\'s 1e-4')
+    parser.add_argument('-tobj', '--target_obj', type = float, default = None, help = 'stop a C step solve once it finds a solution with objective at most this')
+    parser.add_argument('-T', '--total_time', type = float, default = None, help = 'wall clock budget in seconds for the whole run. restarts, coordinate descent iterations and -scan share it, each C step time limit is set from what is left (never above -m), and the best result so far is kept when it runs out')
+    parser.add_argument('-ckpt', '--checkpoint', action = 'store_true', help = 'save the input matrices, every coordinate descent iterate and every finished restart to a checkpoint directory in the output directory')
+    parser.add_argument('-resume', '--resume', action = 'store_true', help = 'resume a run from the checkpoint directory of its output directory. finished restarts are skipped and unfinished ones continue from their last iterate')
+    parser.add_argument('-scan_mode', '--scan_mode', default = 'sequential', choices = ['sequential', 'parallel', 'warm'], help = 'how -scan solves its n values. parallel solves them at once on -p processes. warm starts each n value from the previous solution with its worst fitting leaf split in two')
+    parser.add_argument('-scan_tol', '--scan_tol', type = float, default = None, help = 'stop -scan once the training objective improves by at most this fraction for --scan_patience n values in a row')
+    parser.add_argument('-scan_patience', '--scan_patience', type = int, default = 1, help = 'number of n values in a row below --scan_tol that stop -scan')
+    parser.add_argument('-tb', '--tight_bounds', action = 'store_true', help = 'bound each copy number column of the C step by the ceiling of its largest mixed copy number plus 1 instead of -c. the bound is a guess from the data, not a proof, and can exclude the true optimum')
+    parser.add_argument('-ft', '--fix_tol', type = float, default = None, help = 'with -tb, also fix every segment within this of copy number 1 in every sample at 1 in every clone. this removes low prevalence copy number changes, e.g. a 4%% subclone with copy number 2 looks like 1.04. off by default')
+    parser.add_argument('-sym', '--symmetry_breaking', action = 'store_true', help = 'add rows to the C step that keep one labeling of nodes that are interchangeable, such as the internal nodes with -leaf')
+    parser.add_argument('-cs', '--compress_segments', action = 'store_true', help = 'merge runs of adjacent segments without SV breakpoints whose mixed copy numbers agree in every sample, solve with one weighted segment per run and expand the copy numbers back afterwards')
+    parser.add_argument('-cs_tol', '--compress_tol', type = float, default = cp.SEG_TOL, help = 'largest difference in mixed copy number between segments merged by --compress_segments')
+    parser.add_argument('-ds', '--dedupe_snvs', action = 'store_true', help = 'solve sampled SNVs with the same mixed copy numbers in the same segment as one weighted SNV and give every SNV of a group its solution afterwards')
+    parser.add_argument('-ui', '--u_init', default = 'random', choices = ['random', 'nmf'], help = 'starting U of each restart. nmf factors the segment copy numbers and gives the restarts the most spread out of several factorizations')
 
 # # # # # # # # # # # # # # # # # # # # # # # # #
 #   C A L L   T O   M A I N   F U N C T I O N   #